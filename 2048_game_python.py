@@ -1,11 +1,25 @@
-import pygame
-import random
-
-pygame.init()
+'''
+Program: 2048 game
+Author: Prashanth Reddy Loka
+Description: The pygame window of 2048: draws a Game of game_2048 and turns
+        the arrow keys and the restart button into its moves. The rules and
+        the game state live in game_2048, so they run without a window.
+Revisions: 00 - pygame game with score, restart button, win and game over
+           01 - Thin view over the headless game_2048.Game
+           02 - 'A' toggles the expectimax player of ai_2048
+           03 - Cached tile and label surfaces, dirty-rect updates and a frame cap
+           04 - --record appends every game played to a recording file
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+import sys  # For leaving from the welcome screen
+import pygame  # For the window, drawing and input
+from game_2048 import DOWN, LEFT, RIGHT, UP, Game, seed_option
 
 WIDTH, HEIGHT = 400, 500
 TILE_SIZE = 100
 GRID_SIZE = 4
+AI_WORKERS = 4  # Processes searching the four root moves of the auto-player
 
 # Colors
 WHITE = (255, 255, 255)
@@ -26,26 +40,32 @@ COLORS = {
     2048: (237, 194, 46)
 }
 
-# Font
-font = pygame.font.SysFont("Times New Roman", 40)
-small_font = pygame.font.SysFont("Times New Roman", 30)
+FPS = 60  # Most frames drawn per second
+TEXT_CACHE = 256  # Rendered labels kept before the cache starts over
+SCORE_AREA = pygame.Rect(0, 0, WIDTH - 125, 50)  # Left of the restart button
+HIGH_SCORE_AREA = pygame.Rect(0, 50, WIDTH, 50)  # Between the button and the board
+MESSAGE_POSITIONS = {"You Win!": (WIDTH // 2 - 60, HEIGHT // 2 - 20),
+                     "Game Over!": (WIDTH // 2 - 80, HEIGHT // 2 - 20)}
 
-# Initializing screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("2048")
+# Arrow keys and the moves they play
+KEY_MOVES = {pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT, pygame.K_UP: UP, pygame.K_DOWN: DOWN}
 
-# Initializing grid
-grid = [[0 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
 
-# Score
-score = 0
-high_score = 0
+def open_window():
+    """
+    Starts pygame and opens the game window.
+    Returns:
+        tuple: (screen, font, small_font).
+    """
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("2048")
+    font = pygame.font.SysFont("Times New Roman", 40)
+    small_font = pygame.font.SysFont("Times New Roman", 30)
+    return screen, font, small_font
 
-# Game state
-game_over = False
-win = False
 
-def show_welcome_screen():
+def show_welcome_screen(screen, font):
     screen.fill(WHITE)
     welcome_text = font.render("Welcome to 2048!", True, BLACK)
     start_text = font.render("Click Enter to Start", True, BLACK)
@@ -53,187 +73,217 @@ def show_welcome_screen():
     screen.blit(start_text, (WIDTH // 2 - start_text.get_width() // 2, HEIGHT // 2 + 20))
     pygame.display.flip()
 
+
 def wait_for_enter():
     waiting = True
     while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:  # Enter key
-                    waiting = False
-                    
-def add_new_tile():
-    empty_cells = [(i, j) for i in range(GRID_SIZE) for j in range(GRID_SIZE) if grid[i][j] == 0]
-    if empty_cells:
-        i, j = random.choice(empty_cells)
-        grid[i][j] = 2 if random.random() < 0.9 else 4
-
-def draw_grid():
-    screen.fill(WHITE)
-    for i in range(GRID_SIZE):
-        for j in range(GRID_SIZE):
-            value = grid[i][j]
-            color = COLORS.get(value, WHITE)
-            pygame.draw.rect(screen, color, (j * TILE_SIZE, i * TILE_SIZE + 100, TILE_SIZE, TILE_SIZE))
-            if value != 0:
-                text = font.render(str(value), True, BLACK)
-                text_rect = text.get_rect(center=(j * TILE_SIZE + TILE_SIZE // 2, i * TILE_SIZE + 100 + TILE_SIZE // 2))
-                screen.blit(text, text_rect)
-
-def draw_score():
-    score_text = small_font.render(f"Score: {score}", True, BLACK)
-    high_score_text = small_font.render(f"High Score: {high_score}", True, BLACK)
-    screen.blit(score_text, (10, 10))
-    screen.blit(high_score_text, (10, 50))
-
-def draw_restart_button():
-    pygame.draw.rect(screen, GRAY, (WIDTH - 120, 10, 110, 40))
-    restart_text = small_font.render("Restart", True, BLACK)
-    screen.blit(restart_text, (WIDTH - 110, 15))
-
-def move_left():
-    global score
-    old_grid = [row[:] for row in grid]  # Create a copy of the grid
-    for i in range(GRID_SIZE):
-        row = grid[i]
-        new_row = [cell for cell in row if cell != 0]
-        new_row += [0] * (GRID_SIZE - len(new_row))
-        for j in range(GRID_SIZE - 1):
-            if new_row[j] == new_row[j + 1] and new_row[j] != 0:
-                new_row[j] *= 2
-                score += new_row[j]
-                new_row[j + 1] = 0
-        new_row = [cell for cell in new_row if cell != 0]
-        new_row += [0] * (GRID_SIZE - len(new_row))
-        grid[i] = new_row
-    return old_grid != grid  # Returning True if the grid changed
-
-def move_right():
-    global score
-    old_grid = [row[:] for row in grid]
-    for i in range(GRID_SIZE):
-        row = grid[i]
-        new_row = [cell for cell in row if cell != 0]
-        new_row = [0] * (GRID_SIZE - len(new_row)) + new_row
-        for j in range(GRID_SIZE - 1, 0, -1):
-            if new_row[j] == new_row[j - 1] and new_row[j] != 0:
-                new_row[j] *= 2
-                score += new_row[j]
-                new_row[j - 1] = 0
-        new_row = [cell for cell in new_row if cell != 0]
-        new_row = [0] * (GRID_SIZE - len(new_row)) + new_row
-        grid[i] = new_row
-    return old_grid != grid
-
-def move_up():
-    global score
-    old_grid = [row[:] for row in grid]
-    for j in range(GRID_SIZE):
-        column = [grid[i][j] for i in range(GRID_SIZE)]
-        new_column = [cell for cell in column if cell != 0]
-        new_column += [0] * (GRID_SIZE - len(new_column))
-        for i in range(GRID_SIZE - 1):
-            if new_column[i] == new_column[i + 1] and new_column[i] != 0:
-                new_column[i] *= 2
-                score += new_column[i]
-                new_column[i + 1] = 0
-        new_column = [cell for cell in new_column if cell != 0]
-        new_column += [0] * (GRID_SIZE - len(new_column))
-        for i in range(GRID_SIZE):
-            grid[i][j] = new_column[i]
-    return old_grid != grid
-
-def move_down():
-    global score
-    old_grid = [row[:] for row in grid]
-    for j in range(GRID_SIZE):
-        column = [grid[i][j] for i in range(GRID_SIZE)]
-        new_column = [cell for cell in column if cell != 0]
-        new_column = [0] * (GRID_SIZE - len(new_column)) + new_column
-        for i in range(GRID_SIZE - 1, 0, -1):
-            if new_column[i] == new_column[i - 1] and new_column[i] != 0:
-                new_column[i] *= 2
-                score += new_column[i]
-                new_column[i - 1] = 0
-        new_column = [cell for cell in new_column if cell != 0]
-        new_column = [0] * (GRID_SIZE - len(new_column)) + new_column
-        for i in range(GRID_SIZE):
-            grid[i][j] = new_column[i]
-    return old_grid != grid
-
-def check_game_over():
-    for i in range(GRID_SIZE):
-        for j in range(GRID_SIZE):
-            if grid[i][j] == 0:
-                return False
-            if j < GRID_SIZE - 1 and grid[i][j] == grid[i][j + 1]:
-                return False
-            if i < GRID_SIZE - 1 and grid[i][j] == grid[i + 1][j]:
-                return False
-    return True
-
-def check_win():
-    for row in grid:
-        if 2048 in row:
-            return True
-    return False
-
-def restart_game():
-    global grid, score, game_over, win
-    grid = [[0 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-    score = 0
-    game_over = False
-    win = False
-    add_new_tile()
-    add_new_tile()
-
-show_welcome_screen()
-wait_for_enter()
-
-# Add initial tiles
-add_new_tile()
-add_new_tile()
-
-# Game loop
-running = True
-while running:
-    for event in pygame.event.get():
+        event = pygame.event.wait()  # Sleeps until there is input
         if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            if not game_over and not win:
-                moved = False
-                if event.key == pygame.K_LEFT:
-                    moved = move_left()
-                elif event.key == pygame.K_RIGHT:
-                    moved = move_right()
-                elif event.key == pygame.K_UP:
-                    moved = move_up()
-                elif event.key == pygame.K_DOWN:
-                    moved = move_down()
-                if moved:
-                    add_new_tile()
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            x, y = event.pos
-            if WIDTH - 120 <= x <= WIDTH - 10 and 10 <= y <= 50:
-                restart_game()
-
-    draw_grid()
-    draw_score()
-    draw_restart_button()
-
-    if not win and check_win():
-        win = True
-        win_text = font.render("You Win!", True, BLACK)
-        screen.blit(win_text, (WIDTH // 2 - 60, HEIGHT // 2 - 20))
-
-    if not game_over and check_game_over():
-        game_over = True
-        game_over_text = font.render("Game Over!", True, BLACK)
-        screen.blit(game_over_text, (WIDTH // 2 - 80, HEIGHT // 2 - 20))
+            pygame.quit()
+            sys.exit()
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_RETURN:  # Enter key
+                waiting = False
+
+
+def tile_rect(i, j):
+    """
+    Returns:
+        pygame.Rect: Screen area of the tile in row i, column j.
+    """
+    return pygame.Rect(j * TILE_SIZE, i * TILE_SIZE + 100, TILE_SIZE, TILE_SIZE)
+
+
+class Renderer:
+    """
+    Draws a game, redrawing only what changed since the last frame. Tiles
+    are rendered once per value and labels once per text, then blitted.
+    Attributes:
+        screen (pygame.Surface): Window surface.
+        font, small_font (pygame.font.Font): Tile and label fonts.
+        shown (tuple): (cells, score, high score, message) on screen, None
+            when the whole window must be drawn.
+    """
+    __slots__ = ('screen', 'font', 'small_font', 'shown', '_tiles', '_texts')
+
+    def __init__(self, screen, font, small_font):
+        self.screen = screen
+        self.font = font
+        self.small_font = small_font
+        self.shown = None
+        self._tiles = {}  # Tile value to its rendered surface
+        self._texts = {}  # Label text to its rendered surface
+
+    def tile(self, value):
+        """
+        Returns:
+            pygame.Surface: The tile of a value, rendered on first use.
+        """
+        surface = self._tiles.get(value)
+        if surface is None:
+            surface = pygame.Surface((TILE_SIZE, TILE_SIZE))
+            surface.fill(COLORS.get(value, WHITE))
+            if value != 0:
+                text = self.font.render(str(value), True, BLACK)
+                surface.blit(text, text.get_rect(center=(TILE_SIZE // 2, TILE_SIZE // 2)))
+            self._tiles[value] = surface
+        return surface
+
+    def text(self, text):
+        """
+        Returns:
+            pygame.Surface: A label in the small font, rendered on first use.
+        """
+        surface = self._texts.get(text)
+        if surface is None:
+            if len(self._texts) >= TEXT_CACHE:  # Scores keep growing; start over
+                self._texts.clear()
+            surface = self._texts[text] = self.small_font.render(text, True, BLACK)
+        return surface
+
+    def _label(self, text, position, area):
+        self.screen.fill(WHITE, area)
+        self.screen.blit(self.text(text), position)
+        return area
+
+    def draw(self, grid, score, high_score, message=None):
+        """
+        Brings the window up to date and updates only the changed areas.
+        Parameters:
+            grid (list): Rows of tile values, 0 for empty.
+            score, high_score (int): Scores to show.
+            message (str): 'You Win!', 'Game Over!' or None.
+        """
+        cells = tuple(value for row in grid for value in row)
+        shown = self.shown
+        self.shown = (cells, score, high_score, message)
+        if shown is None or shown[3] != message:  # First frame, or the message changes
+            self.screen.fill(WHITE)
+            for n, value in enumerate(cells):
+                self.screen.blit(self.tile(value), tile_rect(*divmod(n, GRID_SIZE)))
+            self._label(f"Score: {score}", (10, 10), SCORE_AREA)
+            self._label(f"High Score: {high_score}", (10, 50), HIGH_SCORE_AREA)
+            pygame.draw.rect(self.screen, GRAY, (WIDTH - 120, 10, 110, 40))
+            self.screen.blit(self.text("Restart"), (WIDTH - 110, 15))
+            if message:
+                text = self.font.render(message, True, BLACK)
+                self.screen.blit(text, MESSAGE_POSITIONS[message])
+            pygame.display.flip()
+            return
+        dirty = []
+        for n, (old, new) in enumerate(zip(shown[0], cells)):
+            if old != new:
+                dirty.append(self.screen.blit(self.tile(new), tile_rect(*divmod(n, GRID_SIZE))))
+        if score != shown[1]:
+            dirty.append(self._label(f"Score: {score}", (10, 10), SCORE_AREA))
+        if high_score != shown[2]:
+            dirty.append(self._label(f"High Score: {high_score}", (10, 50), HIGH_SCORE_AREA))
+        if dirty:
+            pygame.display.update(dirty)
+
+
+def message(game):
+    """
+    Returns:
+        str: Message shown over the board of a game, None while it goes on.
+    """
+    if game.win:
+        return "You Win!"
+    if game.game_over:
+        return "Game Over!"
+    return None
+
+
+def start_auto_player():
+    """
+    Loads the expectimax player and its process pool on first use.
+    Returns:
+        tuple: (best_move function, pool searching the root moves).
+    """
+    from concurrent.futures import ProcessPoolExecutor  # For searching the root moves in parallel
+    from ai_2048 import best_move
+    return best_move, ProcessPoolExecutor(max_workers=AI_WORKERS)
+
+
+def save_game(game, record):
+    """
+    Appends a game to the recording file, when there is one and the game
+    has moves.
+    """
+    if record and game.moves:
+        from recording_2048 import GameRecord, append_games
+        append_games(record, [GameRecord.of(game)])
+
+
+def main(seed=None, record=None):
+    """
+    Shows the welcome screen, then plays games until the window is closed.
+    The arrow keys move; 'A' switches the expectimax auto-player on and off.
+    Parameters:
+        seed (int): Seed of the first game's tiles, None for a random game.
+        record (str): Recording file every game is appended to, None for none.
+    """
+    screen, font, small_font = open_window()
+    show_welcome_screen(screen, font)
+    wait_for_enter()
+    renderer = Renderer(screen, font, small_font)
+    clock = pygame.time.Clock()
+    game = Game(seed)
+    high_score = 0
+    auto = False  # Whether the auto-player is moving
+    best_move = pool = None
+
+    # Game loop
+    running = True
+    while running:
+        events = pygame.event.get()
+        if not events and not (auto and not game.done):
+            events = [pygame.event.wait()]  # Nothing to do: sleep until there is input
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.shown = None  # Window contents lost; draw everything
+            elif event.type == pygame.KEYDOWN:
+                if event.key in KEY_MOVES:
+                    game.step(KEY_MOVES[event.key])  # Ignored once the game is won or lost
+                elif event.key == pygame.K_a:
+                    auto = not auto
+                    if pool is None:
+                        best_move, pool = start_auto_player()
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                x, y = event.pos
+                if WIDTH - 120 <= x <= WIDTH - 10 and 10 <= y <= 50:
+                    save_game(game, record)
+                    game.reset()
+        if auto and not game.done:
+            game.step(best_move(game.board, pool=pool))  # One move per frame
+        high_score = max(high_score, game.score)
+
+        renderer.draw(game.grid, game.score, high_score, message(game))
+        clock.tick(FPS)  # Frame rate cap
+
+    try:
+        save_game(game, record)
+    finally:  # Close the window even when the recording cannot be written
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        pygame.quit()
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="2048 game")
+    parser.add_argument('--seed', type=seed_option,
+                        help="seed of the first game's tiles, 0 to 2**64 - 1")
+    parser.add_argument('--record', metavar='FILE', help="append every game to a recording file")
+    return parser.parse_args(argv)
 
-    pygame.display.flip()
 
-pygame.quit()
\ No newline at end of file
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.seed, args.record)
@@ -7,22 +7,70 @@ Description: This Python script analyzes earthquake data to provide insights and
         and temporal patterns of seismic events.
 Revisions: 00 - Addressed errors in user inputs to improve the user experience.
            01 - Plotted multiple plots for visualization
+           02 - Filters and plots read the typed columns of earthquake_catalog
+           03 - Dates are parsed once at load time; per-year plots use the year column
+           04 - Selected events are joined with their nearest world city
+           05 - Longitude bins, histogram and average magnitudes come from one binning pass
+           06 - Per-year plots use the catalog group-by aggregates
+           07 - Both data files are loaded through the binary column cache
+           08 - --stream mode aggregates catalogs too large to load in chunks
+           09 - --batch mode renders many queries headless to image files
+           10 - Plot data is computed first and the plots render in a process pool
+           11 - Large selections are drawn as a magnitude density grid
+           12 - Filter stages share a memoized filter chain; 'back' returns to a stage
+           13 - Aftershock sequences are found and plotted against the declustered counts
+           14 - --metrics reports the time, rows and peak memory of every stage
+           15 - --stream without ranges reads the aggregates stored in the cache
+           16 - pyplot and the data files are loaded on first use; --count mode
+           17 - NumPy and the data modules are imported where they are first used
 '''
 # Import necessary libraries
-import csv  # For handling CSV files
-from datetime import datetime as dt  # For working with date and time
-import matplotlib.pyplot as plt  # For creating plots
+import argparse  # For the command line options
+from datetime import datetime as dt, timedelta  # For working with date and time
+import json  # For reading batch query files
+import os  # For the batch output folder
 import math  # For mathematical operations
+from earthquake_constants import (CHUNK_ROWS, CITIES_FILE, EPOCH, SEQUENCE_DAYS,
+                                  SEQUENCE_KM)  # Data files and defaults, without NumPy
+import earthquake_metrics as metrics  # Optional per-stage timings
 
-def scattered_plot(lats, lngVals, mags):
+class _Pyplot:
+    """
+    Stands in for matplotlib.pyplot until a plot is first drawn, so importing
+    this module or running a count-only query never loads the plotting stack.
+    """
+    def __getattr__(self, name):
+        global plt
+        import matplotlib.pyplot as pyplot  # For creating plots
+        plt = pyplot # later calls go straight to pyplot
+        return getattr(pyplot, name)
+
+plt = _Pyplot() # replaced by matplotlib.pyplot on first use
+
+def show_plot(out=None):
+    """
+    Displays the current plot, or saves it to a file for headless runs.
+    Parameters:
+        out (str): File to save the plot to; the format follows its extension.
+    Returns:
+        None
+    """
+    if out is None:
+        plt.show() # Displaying the plot
+    else:
+        plt.savefig(out, bbox_inches='tight') # Saving the plot
+        plt.clf() # Clear the figure so the next plot can reuse it
+
+def scattered_plot(lats, lngVals, mags, out=None):
     """
     Creating a scatter plot of Nuclear Explosion/Rock Burst/Explosion/Earthquake locations.
     Parameters:
         lats (list): List of latitude values.
         lngVals (list): List of longitude values.
         mags (list): List of magnitude values.
+        out (str): File to save the plot to, displayed when None.
     Returns:
-        None (displays the scatter plot).
+        None (displays or saves the scatter plot).
     Plot Description:
         - The x-axis represents the longitude in degrees.
         - The y-axis represents the latitude in degrees.
@@ -37,15 +85,56 @@ def scattered_plot(lats, lngVals, mags):
     plt.ylabel('Latitude in Degrees') # Label the y-axis
     plt.title('Nuclear Explosion/Rock Burst/Explosion/Earthquake Locations') # title
     plt.colorbar(label='Magnitude') # Add a colorbar to indicate the magnitude scale
-    plt.show() # Displaying the plot
+    show_plot(out) # Displaying the plot
 
-def scattered_plot_years(select):
+def density_plot(lat_edges, lng_edges, counts, max_mags, out=None, select=None):
+    """
+    Creating a density plot of Nuclear Explosion/Rock Burst/Explosion/Earthquake
+    locations, used instead of the scatter plot for large selections.
+    Parameters:
+        lat_edges, lng_edges (list): Cell edges of the grid in degrees.
+        counts (array): Number of events in each (latitude, longitude) cell.
+        max_mags (array): Largest magnitude in each cell, NaN when empty.
+        out (str): File to save the plot to, displayed when None.
+        select (Selection): Records of the plot; when given and displayed,
+            zooming re-aggregates the visible box at full grid resolution.
+    Returns:
+        None (displays or saves the density plot).
+    Plot Description:
+        - The x-axis represents the longitude in degrees.
+        - The y-axis represents the latitude in degrees.
+        - Each cell is colored by the largest magnitude of its events.
+    """
+    import numpy as np  # For masking the empty cells
+    mesh = plt.pcolormesh(lng_edges, lat_edges, np.ma.masked_invalid(max_mags), cmap='viridis')
+    plt.xlabel('Longitude in Degrees') # Label the x-axis
+    plt.ylabel('Latitude in Degrees') # Label the y-axis
+    plt.title(f'Nuclear Explosion/Rock Burst/Explosion/Earthquake Locations\n'
+              f'(density of {int(np.sum(counts))} events)') # title
+    plt.colorbar(mesh, label='Maximum Magnitude') # Add a colorbar for the magnitude scale
+    if select is not None and out is None:
+        axes = plt.gca()
+        axes.set_autoscale_on(False) # redrawing must not move the view again
+        shown = {'mesh': mesh}
+        def zoom(axes):
+            # Zoom and pan set the y limits last, so the whole new view is known here
+            lng, lat = sorted(axes.get_xlim()), sorted(axes.get_ylim())
+            grid = select.density(lat=lat, lng=lng) # only the rows in view
+            lat_edges, lng_edges = (axis.edges for axis in grid.axes)
+            shown['mesh'].remove()
+            shown['mesh'] = axes.pcolormesh(lng_edges, lat_edges, np.ma.masked_invalid(grid.max),
+                                            cmap='viridis', norm=mesh.norm)
+        axes.callbacks.connect('ylim_changed', zoom)
+    show_plot(out) # Displaying the plot
+
+def scattered_plot_years(select, out=None):
     """
     Creating a scatter plot of average earthquake magnitudes over the years.
     Parameters:
-        select (list): List of earthquake records.
+        select (Selection): Selected earthquake records.
+        out (str): File to save the plot to, displayed when None.
     Returns:
-        None (displays the scatter plot).
+        None (displays or saves the scatter plot).
     Plot Description:
         - The x-axis represents the years.
         - The y-axis represents the average earthquake 
@@ -56,43 +145,47 @@ def scattered_plot_years(select):
     Note:
         - Valid dates and non-missing magnitudes are considered for calculations.
     """
-    year_magnitudes = {} # Initialize a dictionary to store magnitudes for each year
-    # Iterating through each earthquake record in the selection
-    for record in select: # for loop
-        if 'Date' in record and is_valid_date(record['Date']):# if case
-            year = dt.strptime(record['Date'], '%m/%d/%Y').year # Extracting the year from the date
-            # Extract the magnitude, handle missing or invalid Magnitude values
-            magnitude = float(record.get('Magnitude', 0))
-            # Create an entry in the dictionary for the year if it doesn't exist
-            if year not in year_magnitudes:
-                year_magnitudes[year] = [] # empty list for dictionary values
-            year_magnitudes[year].append(magnitude) # Appending magnitude to year
-    # Calculate the average magnitude for each year
-    avg_years, avg_mags = zip(*[(year, sum(mags) / len(mags))\
-                                for year, mags in year_magnitudes.items()])
+    # Calculate the average magnitude for each year with a valid date
+    by_year = select.group_by('year')
+    # Get the date range from the 'select' data
+    dates = select.date_range() # first and last valid day numbers
+    if dates is None: # no record with a valid date: nothing to plot
+        return
+    first, last = dates
+    start_date = EPOCH + timedelta(days=first) # starting date
+    end_date = EPOCH + timedelta(days=last) # ending date
+    avg_years_plot(by_year.keys, by_year.mean('mag'), start_date, end_date, out)
+
+def avg_years_plot(avg_years, avg_mags, start_date, end_date, out=None):
+    """
+    Draws the scatter plot of average magnitudes per year.
+    Parameters:
+        avg_years (list): Years holding records.
+        avg_mags (list): Average magnitude of each year.
+        start_date, end_date (datetime): Date range shown in the title.
+        out (str): File to save the plot to, displayed when None.
+    Returns:
+        None (displays or saves the scatter plot).
+    """
     # Creating a scatter plot with years on the x-axis, average magnitudes on 
     #the y-axis, size (magnitude), and color (magnitude)
     plt.scatter(avg_years, avg_mags, s=avg_mags, c= avg_mags, cmap='viridis')
     plt.xlabel('Year') # Label the x-axis
     plt.ylabel('Average Magnitude') # Label y-axis
-    # Get the date range from the 'select' data
-    valid_dates = [record['Date'] for record in select if 'Date' in record\
-                   and is_valid_date(record['Date'])]
-    start_date = min(dt.strptime(date, '%m/%d/%Y') for date in valid_dates) # starting date
-    end_date = max(dt.strptime(date, '%m/%d/%Y') for date in valid_dates) # ending date
     plt.title(f'Average Nuclear Explosion/Rock Burst/Explosion/Earthquake Magnitudes\n\
               ({start_date.strftime("%m/%d/%Y")} to {end_date.strftime("%m/%d/%Y")})') # title of plot
     plt.colorbar(label='Average Magnitude') # Adding a colorbar to indicate the magnitude scale
-    plt.show() # Display the plot
+    show_plot(out) # Display the plot
 
-def bar_plot(labels, bar_data):
+def bar_plot(labels, bar_data, out=None):
     """
     Creates and displays a bar plot with longitudes and seismic events.
     Parameters:
         labels (list): List of labels for the x-axis.
         bar_data (list): List of data values for the y-axis.
+        out (str): File to save the plot to, displayed when None.
     Returns:
-        None (displays the plot).
+        None (displays or saves the plot).
     Plot Components:
         - x-axis labeled with 'Longitude Range (degrees)'
         - y-axis labeled with 'Seismic Events'
@@ -104,37 +197,40 @@ def bar_plot(labels, bar_data):
     plt.ylabel('Seismic Events') # label y-axis
     plt.title('Nuclear Explosion/Rock Burst/Explosion/Earthquake Bar Plot') # title
     plt.subplots_adjust(bottom=0.15) # Adjust the bottom margin
-    plt.show() # Displaying the plot
+    show_plot(out) # Displaying the plot
 
-def hist_plot(lngVals, ran):
+def hist_plot(counts, edges, out=None):
     """
     Creates and displays a histogram plot.
     Parameters:
-        lngVals (list): List of longitude values for the histogram.
-        ran (tuple): Tuple representing the range of the histogram.
+        counts (list): Number of longitude values in each bin.
+        edges (list): Bin edges, one more than the number of bins.
+        out (str): File to save the plot to, displayed when None.
     Returns:
-        None (displays the plot).
+        None (displays or saves the plot).
     Plot Components:
         - Histogram with specified bins and range
         - x-axis labeled with 'Longitude Range (degrees)'
         - y-axis labeled with 'Number of Events'
         - Title: 'Nuclear Explosion/Rock Burst/Explosion/Earthquake Histogram'
     """
-    plt.hist(lngVals, bins=6, range=ran) # Create a histogram plot
+    # Create a histogram plot from the already counted bins
+    plt.hist(edges[:-1], bins=edges, weights=counts)
     plt.xlabel('Longitude Range (degrees)') # label x-axis
     plt.ylabel('Number of Events') # label y-axis
     # Setting the title of the plot
     plt.title('Nuclear Explosion/Rock Burst/Explosion/Earthquake longitudes Histogram')
-    plt.show() # Displaying the plot
+    show_plot(out) # Displaying the plot
 
-def avg_mags_plot(labels, avg_mags):
+def avg_mags_plot(labels, avg_mags, out=None):
     """
     Creates and displays a bar plot of average magnitudes.
     Parameters:
         labels (list): List of labels for each bar.
         avg_mags (list): List of average magnitude values.
+        out (str): File to save the plot to, displayed when None.
     Returns:
-        None (displays the plot).
+        None (displays or saves the plot).
     Plot Components:
         - Bar plot with specified labels and average magnitude values
         - x-axis labeled with 'Longitude Range (degrees)'
@@ -148,17 +244,18 @@ def avg_mags_plot(labels, avg_mags):
     # Setting the title of the plot
     plt.title('Average magnitude plot')
     plt.subplots_adjust(bottom=0.15) # Adjust the bottom space for better layout
-    plt.show() # Displaying the plot
+    show_plot(out) # Displaying the plot
     
-def bar_plot_years(select):
+def bar_plot_years(select, out=None):
     """
     Creates and displays a bar plot illustrating the number of seismic events per year.
 
     Parameters:
-        select (list): List of earthquake records.
+        select (Selection): Selected earthquake records.
+        out (str): File to save the plot to, displayed when None.
 
     Returns:
-        None: Displays the bar plot.
+        None: Displays or saves the bar plot.
 
     Plot Description:
         - The x-axis represents the years.
@@ -166,30 +263,52 @@ def bar_plot_years(select):
         - Provides a visual representation of the distribution of seismic events over time.
     """
     # Count the number of events for each year
-    year_counts = {}
-    for record in select:
-        if 'Date' in record and is_valid_date(record['Date']):
-            year = dt.strptime(record['Date'], '%m/%d/%Y').year
-            if year not in year_counts:
-                year_counts[year] = 0
-            year_counts[year] += 1
-
-    years, event_counts = zip(*sorted(year_counts.items()))
+    by_year = select.group_by('year')
+    years_bar_plot(by_year.keys, by_year.count(), out)
 
+def years_bar_plot(years, event_counts, out=None):
+    """
+    Draws the bar plot of seismic events per year.
+    Parameters:
+        years (list): Years holding records.
+        event_counts (list): Number of records in each year.
+        out (str): File to save the plot to, displayed when None.
+    Returns:
+        None: Displays or saves the bar plot.
+    """
     # Creating a bar plot
     plt.bar(years, event_counts)
     plt.xlabel('Year')  # Label the x-axis
     plt.ylabel('Number of Seismic Events')  # Label the y-axis
     plt.title('Number of Seismic Events Over the Years')  # Title
-    plt.show()  # Displaying the plot
+    show_plot(out)  # Displaying the plot
+
+def sequences_plot(years, event_counts, main_years, main_counts, out=None):
+    """
+    Draws the events per year next to the events left once the aftershocks
+    are taken out.
+    Parameters:
+        years, event_counts (list): Years holding records and their record counts.
+        main_years, main_counts (list): Years holding mainshocks and their counts.
+        out (str): File to save the plot to, displayed when None.
+    Returns:
+        None: Displays or saves the plot.
+    """
+    plt.plot(years, event_counts, label='All events') # every selected event
+    plt.plot(main_years, main_counts, label='Mainshocks only') # declustered catalog
+    plt.xlabel('Year')  # Label the x-axis
+    plt.ylabel('Number of Seismic Events')  # Label the y-axis
+    plt.title('Seismic Events With and Without Aftershocks')  # Title
+    plt.legend() # which line is which
+    show_plot(out)  # Displaying the plot
 
-def latitude(select):
+def latitude(chain):
     """
    Collects latitude values from user input.
    Parameters:
-       select (list): List of earthquake records.
+       chain (FilterChain): Filter stages of the earthquake records.
    Returns:
-       list: Selected earthquake records based on latitude range.
+       Selection: Selected earthquake records based on latitude range.
    """
    # Display instructions for latitude input
     print("SELECT latitude: enter two values separated by comma\
@@ -205,7 +324,7 @@ def latitude(select):
             continue # continue while loop
         d = {'min': mini, 'max': maxi} # Create a dictionary
         # Filter records based on the entered latitude range
-        selected = [x for x in select if mini <= float(x['Latitude']) <= maxi]
+        selected = chain.apply('lat', mini, maxi)
         # Print accepted information and selected record count
         print(f"Accepted...\n{d}\nSelected {len(selected)} records.\n")
         # Ask user if they want to move on to longitude
@@ -219,13 +338,14 @@ def latitude(select):
         else: # else case
             continue # continue
     
-def longitude(select):
+def longitude(chain):
     """
     Collects longitude values from user input.
     Parameters:
-        select (list): List of earthquake records.
+        chain (FilterChain): Filter stages of the earthquake records.
     Returns:
-        list: Selected earthquake records based on longitude range.
+        Selection: Selected earthquake records based on longitude range, or
+            None to go back to latitude.
 """
     # Display instructions for longitude input
     print("\nSELECT longitude: enter two values separated by comma\
@@ -241,17 +361,19 @@ def longitude(select):
         # Create a dictionary to represent the selected range
         d = {'min': mini, 'max': maxi}
         # Filter records based on the entered longitude range
-        selected = [x for x in select if mini <= float(x['Longitude']) <= maxi]
+        selected = chain.apply('lng', mini, maxi)
         # Print accepted information and selected record count
         print(f"Accepted...\n{d}\nSelected {len(selected)} records.\n")
         # Ask user if they want to move on to dates
-        move = input("Want to move on to dates? Ok/no: ")
+        move = input("Want to move on to dates? Ok/no/back: ")
         # Handle cases where the user did not provide a response
         if not move:
-            move = input("Please respond. Want to move on to dates? Ok/no: ") # user prompt
+            move = input("Please respond. Want to move on to dates? Ok/no/back: ") # user prompt
         # Check if user wants to proceed to dates or stay with longitude
         if move.lower() == 'ok':
             return selected # return selected if ok
+        elif move.lower() == 'back':
+            return None # return to latitude
         else: # else case
             continue # continuing the loop
 
@@ -269,15 +391,16 @@ def is_valid_date(date_string):
     except ValueError: # valueError
         return False # If an error occurs during parsing, the date is not valid
 
-def date(select):
+def date(chain):
     """
     Allows the user to select date ranges within a specified range.
 
     Parameters:
-        select (list): List of records to filter based on date.
+        chain (FilterChain): Filter stages of the records.
 
     Returns:
-        list: Selected records within the specified date range.
+        Selection: Selected records within the specified date range, or None
+            to go back to longitude.
     """
     print("\nSELECT date mm/dd/yyyy: enter two values separated by comma\
           \nrange is 01/02/1965 to 12/30/2016") # Display instructions for date input
@@ -295,28 +418,30 @@ def date(select):
         # Creating a dictionary to represent the selected date range
         d = {'min': date1.strftime("%m/%d/%Y"), 'max': date2.strftime("%m/%d/%Y")}
         # Filter records based on the entered date range
-        selected = [x for x in select if is_valid_date(x['Date']) and
-                    date1 <= dt.strptime(x['Date'], '%m/%d/%Y') <= date2]
+        selected = chain.apply('day', (date1 - EPOCH).days, (date2 - EPOCH).days)
         # Print accepted information and the count of selected records
         print(f"Accepted...\n{d}\nSelected {len(selected)} records.\n")
         # Ask the user if they want to move on to Magnitude
-        move = input("Want to move on to Magnitude? sure/no: ")
+        move = input("Want to move on to Magnitude? sure/no/back: ")
         # Handle cases where the user did not provide a response
         if not move:
-            move = input("Please respond. Want to move on to Magnitude? sure/no: ")
+            move = input("Please respond. Want to move on to Magnitude? sure/no/back: ")
         # Check if the user wants to proceed to Magnitude or stay with date
         if move.lower() == 'sure':
             return selected  # Return selected records if 'sure'
+        elif move.lower() == 'back':
+            return None  # Return to longitude
         else:
             continue  # Continue the loop if the user chooses not to proceed
 
-def magnitude(select):
+def magnitude(chain):
     """
     Allows the user to select records within a specified Magnitude range.
     Parameters:
-        select (list): List of records to filter based on Magnitude.
+        chain (FilterChain): Filter stages of the records.
     Returns:
-        list: Selected records within the specified Magnitude range.
+        Selection: Selected records within the specified Magnitude range, or
+            None to go back to dates.
     """
     # Display instructions for Magnitude input
     print("\nSELECT Magnitude: enter two values separated by comma\nrange is 5.5 through 9.1")
@@ -331,67 +456,389 @@ def magnitude(select):
         # Create a dictionary to represent the selected Magnitude range
         d = {'min': float(mini), 'max': float(maxi)}
         # Filter records based on the entered Magnitude range
-        selected = [x for x in select if mini <= float(x['Magnitude']) <= maxi]
+        selected = chain.apply('mag', mini, maxi)
         # Print accepted information and the count of selected records
         print(f"Accepted...\n{d}\nSelected {len(selected)} records.\n")
         # Ask the user if they want to move on to Analysis
-        move = input("Want to move on to Analysis? ok/no:  ")
+        move = input("Want to move on to Analysis? ok/no/back:  ")
         # Handle cases where the user did not provide a response
         if not move:
-            move = input("Please respond. Want to move on to Analysis? ok/no: ") # user prompt
+            move = input("Please respond. Want to move on to Analysis? ok/no/back: ") # user prompt
         # Check if the user wants to proceed to Analysis or stay with Magnitude
         if move.lower() == 'ok':
             return selected  # Return selected records if 'ok'
+        elif move.lower() == 'back':
+            return None  # Return to dates
         else: # else case
             print("\nSELECT Magnitude: enter two values separated by comma\
                   \nrange is 5.5 through 9.1")
             continue # continue loop
 
-if __name__ == "__main__":
-    print("*** Earthquake Data ***")  # Title of the project
-    # Open earthquake and world cities data files for reading
-    with open("earthquakesF23.csv", 'r') as e, open('worldcitiesF23.csv', 'r') as w:
-        earth = csv.DictReader(e) # Create a DictReader object for earthquake data
-        world = csv.DictReader(w) # Create a DictReader object for world cities data
-        ear_data = [i for i in earth] # Create a list containing dictionaries of earthquake data
-        world_data = [i for i in world] # Create a list containing dictionaries of world cities data
-    select = ear_data  # Set the default selection to all earthquake data
-    print('Do you want to manually enter the Data selection? Yes/No: ') # printing
-    if input().lower() == 'yes': # if case user input
-        # If the user wants to manually select data, apply filters based on user input
-        select = latitude(select) # calling latitude function
-        select = longitude(select) # calling longitude function
-        select = date(select) # calling date function
-        select = magnitude(select) # calling magnitude function
-    # Extract latitude, longitude, and magnitude values from the selected records
-    lats = [float(i['Latitude']) for i in select] # latitude values
-    lngVals = [float(i['Longitude']) for i in select] # longitude values
-    mags = [float(i['Magnitude']) for i in select] # magnitue values
-    
-    scattered_plot(lats, lngVals, mags) # Scatter plot of earthquake locations
-    scattered_plot_years(select) # Scatter plot - average magnitudes over years
+def nearest_cities(select, cities, top=5, within_km=100):
+    """
+    Tags each selected record with its nearest city and prints the cities
+    closest to the most seismic events.
+    Parameters:
+        select (Selection): Selected earthquake records.
+        cities (CityTable): World cities table.
+        top (int): Number of cities to print.
+        within_km (float): Distance used for the population count.
+    Returns:
+        tuple: (city, km, population) arrays for the selected records; city is
+            the row of the nearest city in the table and km its distance.
+    """
+    import numpy as np  # For counting the records of each city
+    city, km = cities.nearest(select.lat, select.lng) # nearest city of every record
+    population = cities.population_within(select.lat, select.lng, within_km)
+    # Count the records tagged with each city, most tagged first
+    ids, counts = np.unique(city[city >= 0], return_counts=True)
+    print("Cities nearest to the most seismic events:")
+    for i in np.argsort(-counts, kind='stable')[:top]: # for loop
+        print(f"  {cities.name[ids[i]]}, {cities.country[ids[i]]} "
+              f"(population {np.nan_to_num(cities.pop[ids[i]]):,.0f}): {counts[i]} events, "
+              f"median distance {np.median(km[city == ids[i]]):.0f} km")
+    print(f"{np.count_nonzero(population)} events within {within_km} km of a populated city\n")
+    return city, km, population
+
+def aftershock_sequences(select, window=(SEQUENCE_KM, SEQUENCE_DAYS), top=5):
+    """
+    Attaches the selected records to their mainshocks and prints the
+    largest aftershock sequences.
+    Parameters:
+        select (Selection): Selected earthquake records.
+        window (tuple): (km, days) of an aftershock from its mainshock.
+        top (int): Number of sequences to print.
+    Returns:
+        numpy.ndarray: Catalog row of the mainshock of each selected record.
+    """
+    import numpy as np  # For counting the aftershocks of each mainshock
+    mainshock = select.sequences(*window) # mainshock of every record
+    catalog = select.catalog
+    rows = np.arange(len(catalog)) if select.rows is None else select.rows
+    # Count the aftershocks attached to each mainshock, largest sequence first
+    ids, counts = np.unique(mainshock[mainshock != rows], return_counts=True)
+    print(f"{len(np.unique(mainshock))} sequences within {window[0]:g} km and {window[1]} days:")
+    for i in np.argsort(-counts, kind='stable')[:top]: # for loop
+        row = ids[i] # row of the mainshock in the catalog, maybe outside the selection
+        when = (EPOCH + timedelta(days=int(catalog.day[row]))).strftime("%m/%d/%Y")
+        print(f"  M{catalog.mag[row]:.1f} on {when} at ({catalog.lat[row]:.2f}, "
+              f"{catalog.lng[row]:.2f}): {counts[i]} aftershocks")
+    print()
+    return mainshock
+
+# Query option name for each filtered catalog column
+RANGE_OPTIONS = (('lat', 'lat'), ('lng', 'lng'), ('day', 'dates'), ('mag', 'mag'))
+# Selections larger than this are drawn with density_plot instead of scattered_plot
+DENSITY_THRESHOLD = 100000
+# File name suffix of each analysis plot in batch mode
+PLOT_NAMES = ('locations', 'yearly_magnitudes', 'longitude_bars', 'longitude_histogram',
+              'yearly_counts', 'longitude_magnitudes', 'sequences')
+
+def to_range(mini, maxi):
+    """
+    Orders and converts the two values of a range.
+    Parameters:
+        mini, maxi (str or float): Two numbers or two mm/dd/yyyy dates.
+    Returns:
+        tuple: (minimum, maximum) as floats, or as day numbers for dates.
+    """
+    if isinstance(mini, str) and is_valid_date(mini) and is_valid_date(maxi): # dates
+        mini, maxi = ((dt.strptime(v, '%m/%d/%Y') - EPOCH).days for v in (mini, maxi))
+    mini, maxi = float(mini), float(maxi)
+    return min(mini, maxi), max(mini, maxi)
+
+def value_range(text):
+    """
+    Parses a 'minimum,maximum' command line value.
+    Parameters:
+        text (str): Two numbers or two mm/dd/yyyy dates separated by a comma.
+    Returns:
+        tuple: (minimum, maximum) as floats, or as day numbers for dates.
+    """
+    return to_range(*text.split(','))
+
+def query_bounds(query):
+    """
+    Converts the ranges of a query into catalog filter bounds.
+    Parameters:
+        query (dict): Option name ('lat', 'lng', 'dates', 'mag') mapped to a
+            (minimum, maximum) pair; missing options are not filtered.
+    Returns:
+        dict: Catalog column name mapped to a (minimum, maximum) tuple.
+    """
+    return {column: to_range(*query[option]) for column, option in RANGE_OPTIONS
+            if query.get(option) is not None}
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Parameters:
+        argv (list): Arguments to parse, the command line by default.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Earthquake data visualization")
+    parser.add_argument('--stream', action='store_true',
+                        help="aggregate the catalog in chunks instead of loading it")
+    parser.add_argument('--count', action='store_true',
+                        help="print the number of records inside the ranges, without plots")
+    parser.add_argument('--batch', metavar='QUERIES',
+                        help="JSON file with a list of queries to render without prompts")
+    parser.add_argument('--out-dir', default='reports', help="folder for --batch plots")
+    parser.add_argument('--format', default='png', choices=('png', 'svg', 'pdf'),
+                        help="image format of --batch plots")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes rendering --batch plots, 1 to render in order")
+    parser.add_argument('--file', default="earthquakesF23.csv", help="earthquake CSV file")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help="rows parsed at a time in --stream mode")
+    parser.add_argument('--metrics', metavar='TARGET',
+                        help="record the time, rows and peak memory of every stage: "
+                             "'-' for log lines, otherwise a JSON lines file "
+                             f"(same as the {metrics.METRICS_ENV} environment variable)")
+    parser.add_argument('--metrics-memory', action='store_true',
+                        help="with --metrics, also trace Python allocations for each "
+                             "stage's peak; much slower for parsing and plotting")
+    # Ranges for --stream and --count modes; use --lat=-10,40 for negative values
+    parser.add_argument('--lat', type=value_range, help="minimum,maximum latitude")
+    parser.add_argument('--lng', type=value_range, help="minimum,maximum longitude")
+    parser.add_argument('--dates', type=value_range, help="minimum,maximum mm/dd/yyyy date")
+    parser.add_argument('--mag', type=value_range, help="minimum,maximum magnitude")
+    # Aftershock sequence window
+    parser.add_argument('--sequence-km', type=float, default=SEQUENCE_KM,
+                        help="largest distance of an aftershock from its mainshock")
+    parser.add_argument('--sequence-days', type=int, default=SEQUENCE_DAYS,
+                        help="largest number of days between an aftershock and its mainshock")
+    return parser.parse_args(argv)
+
+def stream_report(args):
+    """
+    Filters and aggregates the catalog one chunk at a time, printing the
+    per-year statistics and plotting the longitude bins. Without ranges the
+    aggregates kept in the cache are used, which only costs the rows
+    appended since the last run.
+    Parameters:
+        args (argparse.Namespace): Parsed command line options.
+    Returns:
+        RunningAggregates: Aggregates of the selected records.
+    """
+    from earthquake_cache import cached_aggregates  # Aggregates kept with the cache
+    from earthquake_catalog import stream_aggregates  # Chunked aggregation
+    bounds = query_bounds(vars(args)) # only the ranges given
+    with metrics.stage('stream aggregates') as timed:
+        totals = None if bounds else cached_aggregates(args.file) # whole catalog
+        if totals is None:
+            totals = stream_aggregates(args.file, bounds, chunk_rows=args.chunk_rows)
+        timed.rows_out = totals.rows
+    print(f"Selected {totals.rows} records.")
+    if totals.first_day is not None:
+        print(f"{(EPOCH + timedelta(days=totals.first_day)).strftime('%m/%d/%Y')} to "
+              f"{(EPOCH + timedelta(days=totals.last_day)).strftime('%m/%d/%Y')}")
+    for year, count, mean in zip(*totals.years()): # per-year table
+        print(f"  {year}: {count} events, average magnitude {mean:.2f}")
+    edges = totals.by_lng.axes[0].edges
+    labels = ["{:.2f} to\n{:.2f}".format(low, high) for low, high in zip(edges, edges[1:])]
+    bar_plot(labels, totals.by_lng.count) # calling bar plot function
+    avg_mags_plot(labels, totals.by_lng.mean(empty=0)) # average magnitude plot
+    return totals
+
+def analysis_plots(select, zoomable=False, window=(SEQUENCE_KM, SEQUENCE_DAYS)):
+    """
+    Computes the data of every analysis plot before anything is drawn.
+    Parameters:
+        select (Selection): Selected earthquake records.
+        zoomable (bool): Lets a displayed density plot re-aggregate on zoom.
+        window (tuple): (km, days) of an aftershock from its mainshock.
+    Returns:
+        dict: Plot name (see PLOT_NAMES) mapped to a (plot function, arguments)
+            pair; the arguments are plain arrays, so they can be sent to
+            another process for rendering. yearly_magnitudes is left out
+            when no selected record has a valid date.
+    """
+    import numpy as np  # For working with the catalog columns
+    from earthquake_catalog import Axis  # For the longitude bins
+    # Latitude, longitude, and magnitude columns of the selected records
+    lats = np.asarray(select.lat) # latitude values
+    lngVals = np.asarray(select.lng) # longitude values
+    mags = np.asarray(select.mag) # magnitue values
+    # Average magnitudes and event counts for each year with a valid date
+    by_year = select.group_by('year')
+    main_by_year = select.mainshocks(*window).group_by('year') # declustered counts
+    dates = select.date_range() # first and last valid day numbers, None without any
     
-    start = math.floor(min(lngVals)) # Calculating minimum longitude value
-    end = math.ceil(max(lngVals)) # calculating max lonitude value
+    start = math.floor(lngVals.min()) # Calculating minimum longitude value
+    end = math.ceil(lngVals.max()) # calculating max lonitude value
     bins = 6  # Adjust this based on your requirements
     width = (end - start) / bins # calculating width of bins
-    edges = [(int(start + i * width), []) for i in range(1, bins + 1)] # edges
-    lngRecs = dict(edges) # Create dictionary to store records for each longitude bin
-    # Group records into longitude ranges
-    for i in select: # for loop
-        for edge, j in lngRecs.items(): # for loop using lngrecs
-            if float(i['Longitude']) < edge: # if case
-                j.append(i) # appending lngRecs values
-                break # breaking loop
+    edges = [int(start + i * width) for i in range(1, bins + 1)] # upper edge of each bin
+    # Group records into longitude ranges: each record goes to the first edge above it
+    lngRecs = select.bins({'lng': Axis(edges=[-np.inf] + edges, closed=False)})
     label_formatting = "{:.2f} to\n{:.2f}" # Format labels for the longitude bins
-    labels = [label_formatting.format(edge - width, edge) for edge in lngRecs.keys()]
-    data = [len(i) for i in lngRecs.values()] # Calculate data for bar plot 
-    ranging = (start, end) # range of longitudes
-    # Calculating average magnitudes for each longitude bin
-    avg_magnitudes = [sum([float(i['Magnitude']) for i in records]) / len(records)\
-                      if records else 0 for records in lngRecs.values()]
-    
-    bar_plot(labels, data) # calling bar plot function
-    hist_plot(lngVals, ranging) # calling histogram plot function
-    bar_plot_years(select) # calling function
-    avg_mags_plot(labels, avg_magnitudes) # caling average magnitude plot function
\ No newline at end of file
+    labels = [label_formatting.format(edge - width, edge) for edge in edges]
+    data = lngRecs.count # Calculate data for bar plot
+    # Average magnitudes for each longitude bin, 0 for empty bins
+    avg_magnitudes = lngRecs.mean(empty=0)
+    # Equal width longitude bins over the range for the histogram
+    lngHist = select.bins({'lng': Axis(start, end, bins)})
+    if len(select) > DENSITY_THRESHOLD: # too many points to scatter
+        south = math.floor(lats.min()) # grid box around the selection
+        grid = select.density(lat=(south, max(math.ceil(lats.max()), south + 1)),
+                              lng=(start, max(end, start + 1)))
+        lat_edges, lng_edges = (axis.edges for axis in grid.axes)
+        locations = (density_plot, (lat_edges, lng_edges, grid.count, grid.max) +
+                     ((None, select) if zoomable else ()))
+    else:
+        locations = (scattered_plot, (lats, lngVals, mags))
+    plots = {'locations': locations}
+    if dates is not None: # the title needs the date range
+        plots['yearly_magnitudes'] = (avg_years_plot, (by_year.keys, by_year.mean('mag'),
+                                                       EPOCH + timedelta(days=dates[0]),
+                                                       EPOCH + timedelta(days=dates[1])))
+    plots.update({'longitude_bars': (bar_plot, (labels, data)),
+                  'longitude_histogram': (hist_plot, (lngHist.count, lngHist.axes[0].edges)),
+                  'yearly_counts': (years_bar_plot, (by_year.keys, by_year.count())),
+                  'longitude_magnitudes': (avg_mags_plot, (labels, avg_magnitudes)),
+                  'sequences': (sequences_plot, (by_year.keys, by_year.count(),
+                                                 main_by_year.keys, main_by_year.count()))})
+    return plots
+
+def render_plot(name, plot, args, out):
+    """
+    Saves one plot, reusing the figure kept for that plot name, so a worker
+    rendering many reports does not build a new figure each time.
+    Parameters:
+        name (str): Plot name, used as the figure label.
+        plot (function): Plot function, such as bar_plot.
+        args (tuple): Arguments of the plot function.
+        out (str): File to save the plot to.
+    Returns:
+        str: The file written.
+    """
+    with metrics.stage('plot ' + name):
+        plt.figure(name) # figure template for this plot
+        plt.clf()
+        plot(*args, out=out)
+    return out
+
+def analysis(select, cities, out=None, fmt='png', pool=None,
+             window=(SEQUENCE_KM, SEQUENCE_DAYS)):
+    """
+    Runs the analysis stage on the selected records: nearest cities,
+    aftershock sequences and plots.
+    Parameters:
+        select (Selection): Selected earthquake records.
+        cities (CityTable): World cities table, loaded here when None.
+        out (str): Path prefix the plots are saved under, displayed when None.
+        fmt (str): Image format of saved plots.
+        pool (ProcessPoolExecutor): Renders saved plots concurrently when given.
+        window (tuple): (km, days) of an aftershock from its mainshock.
+    Returns:
+        list: Futures of the plots submitted to the pool, empty otherwise.
+    """
+    if cities is None:
+        from earthquake_cache import cached_cities  # Cached world cities table
+        cities = cached_cities(CITIES_FILE) # first needed here
+    nearest_cities(select, cities) # Nearest world city of the selected records
+    aftershock_sequences(select, window) # Largest aftershock sequences
+    with metrics.stage('plot data', len(select)):
+        plots = analysis_plots(select, zoomable=out is None, window=window) # all plot data, up front
+    if out is None:
+        for name, (plot, args) in plots.items(): # displayed one after another
+            with metrics.stage('plot ' + name): # includes the time the window is open
+                plot(*args)
+        return []
+    # File of each plot, {out}_{name}.{fmt}
+    files = {name: f"{out}_{name}.{fmt}" for name in PLOT_NAMES}
+    if pool is None:
+        for name, (plot, args) in plots.items():
+            render_plot(name, plot, args, files[name])
+        return []
+    return [pool.submit(render_plot, name, plot, args, files[name])
+            for name, (plot, args) in plots.items()]
+
+def batch_report(args):
+    """
+    Renders the analysis of every query in a JSON file without prompts.
+    The catalog, cities table and their indexes are loaded once and shared
+    by all queries; plots are saved with a non-interactive backend.
+    Parameters:
+        args (argparse.Namespace): Parsed command line options. args.batch is
+            a JSON list of queries such as
+            {"name": "japan", "lat": [30, 46], "lng": [128, 146],
+             "dates": ["01/01/1990", "12/31/2016"], "mag": [6, 9.1]}.
+    Returns:
+        dict: Query name mapped to its number of selected records.
+    """
+    from concurrent.futures import ProcessPoolExecutor  # For rendering plots in parallel
+    from contextlib import nullcontext  # For running without a pool
+    from earthquake_cache import cached_catalog, cached_cities  # Cached data files
+    plt.switch_backend('Agg') # headless rendering
+    with open(args.batch, 'r') as q:
+        queries = json.load(q) # list of query dictionaries
+    catalog = cached_catalog(args.file) # loaded once for every query
+    cities = cached_cities(CITIES_FILE)
+    os.makedirs(args.out_dir, exist_ok=True)
+    # Worker processes render the plots while the next queries are computed
+    workers = ProcessPoolExecutor(args.workers, initializer=plt.switch_backend,
+                                  initargs=('Agg',)) if args.workers > 1 else nullcontext()
+    selected, rendering = {}, []
+    with workers as pool: # the workers are shut down even when a query fails
+        for number, query in enumerate(queries, start=1): # for loop over the queries
+            name = str(query.get('name', f"query{number}"))
+            try:
+                bounds = query_bounds(query)
+            except (TypeError, ValueError) as error: # badly formed range
+                print(f"Skipping {name}: {error}")
+                continue
+            try:
+                with metrics.stage('filter ' + name, len(catalog)) as timed:
+                    select = catalog.all().where(**bounds) # indexed range query
+                    timed.rows_out = len(select)
+                selected[name] = len(select)
+                print(f"{name}: Selected {len(select)} records.")
+                if len(select): # nothing to plot for an empty selection
+                    futures = analysis(select, cities, os.path.join(args.out_dir, name),
+                                       args.format, pool, (args.sequence_km, args.sequence_days))
+                    rendering += [(name, future) for future in futures]
+            except Exception as error: # one failing query does not stop the batch
+                print(f"Query {name} failed: {error!r}")
+        for name, future in rendering:
+            try:
+                future.result() # wait, and report any rendering error
+            except Exception as error:
+                print(f"Rendering {name} failed: {error!r}")
+    return selected
+
+if __name__ == "__main__":
+    args = parse_args() # command line options
+    if args.metrics:
+        metrics.enable(args.metrics, args.metrics_memory) # also switches on the worker processes
+    print("*** Earthquake Data ***")  # Title of the project
+    from earthquake_cache import cached_catalog  # Cached typed columns of the catalog
+    from earthquake_catalog import FilterChain  # Memoized filter stages
+    if args.stream:
+        stream_report(args) # chunked aggregation of a large catalog
+    elif args.batch:
+        batch_report(args) # many queries rendered to files
+    elif args.count:
+        # Only the catalog columns are needed: no cities table, no plots
+        select = cached_catalog(args.file).all().where(**query_bounds(vars(args)))
+        print(f"Selected {len(select)} records.")
+    else:
+        print('Do you want to manually enter the Data selection? Yes/No: ') # printing
+        manual = input().lower() == 'yes' # asked before anything is loaded
+        catalog = cached_catalog(args.file) # Typed columns of the earthquake data
+        select = catalog.all()  # Set the default selection to all earthquake data
+        if manual: # if case user input
+            # If the user wants to manually select data, apply filters based on user input
+            chain = FilterChain(catalog) # remembers each stage, so going back is cheap
+            stages = (latitude, longitude, date, magnitude) # filter stages in order
+            stage = 0 # current stage
+            while stage < len(stages):
+                if stages[stage](chain) is None: # 'back' to the previous stage
+                    stage -= 1
+                else: # stage accepted
+                    stage += 1
+            select = chain.selection() # records left after every stage
+        # nearest cities, aftershock sequences and plots
+        analysis(select, None, window=(args.sequence_km, args.sequence_days))
@@ -0,0 +1,303 @@
+'''
+Program: 2048 expectimax player
+Author: Prashanth Reddy Loka
+Description: Picks 2048 moves by expectimax search on the packed boards of
+        bitboard_2048. Move nodes take the best of the four moves; chance
+        nodes average over every empty cell receiving a 2 (90%) or a 4 (10%),
+        the spawn rule of add_new_tile. Boards already searched as deeply are
+        answered from a transposition table, branches less likely than
+        PROB_CUTOFF are evaluated instead of searched, and the depth grows as
+        the board fills. Leaves are scored with per-row heuristic tables
+        (empty cells, merges, monotonicity and tile size) over rows and
+        columns. The four root moves can be searched in parallel in a process
+        pool, and many games can be played across all cores:
+            python ai_2048.py --games 1000 --workers 8
+Revisions: 00 - Expectimax search, heuristic tables and batch evaluation
+           01 - --record saves the games for recording_2048
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+from collections import Counter  # For the largest tile of each game
+import os  # For the number of cores
+import time  # For the moves per second
+from bitboard_2048 import DIRECTIONS, MOVES, ROW_LEFT, ROW_RIGHT, count_empty, transpose
+from game_2048 import SEED_LIMIT, play, seed_option
+
+# Heuristic weights of one row; the same row is scored the same way as a column
+LOST_PENALTY = 200000.0  # Added to every live row, so lost boards score far lower
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+PROB_CUTOFF = 0.0001  # Branches less likely than this are not searched further
+SPAWNS = ((1, 0.9), (2, 0.1))  # Exponent and probability of a new tile
+MIN_DEPTH, MAX_DEPTH = 2, 4  # Moves searched, including the first one
+
+
+def _row_heuristic(cells):
+    """
+    Scores one row or column of exponents; higher is better.
+    Parameters:
+        cells (list): Exponents of the four cells, 0 for empty.
+    Returns:
+        float: Heuristic value.
+    """
+    empty = cells.count(0)
+    merges = 0
+    previous = counter = 0
+    for cell in cells:
+        if cell == 0:
+            continue
+        if cell == previous:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+        previous = cell
+    if counter > 0:
+        merges += 1 + counter
+    left = right = 0.0
+    for a, b in zip(cells, cells[1:]):
+        if a > b:
+            left += a ** MONOTONICITY_POWER - b ** MONOTONICITY_POWER
+        else:
+            right += b ** MONOTONICITY_POWER - a ** MONOTONICITY_POWER
+    size = sum(cell ** SUM_POWER for cell in cells)
+    return (LOST_PENALTY + EMPTY_WEIGHT * empty + MERGES_WEIGHT * merges -
+            MONOTONICITY_WEIGHT * min(left, right) - SUM_WEIGHT * size)
+
+
+def _build_heuristic():
+    """
+    Returns:
+        list: Heuristic value of every packed row.
+    """
+    return [_row_heuristic([(row >> (4 * j)) & 0xF for j in range(4)]) for row in range(65536)]
+
+
+ROW_HEURISTIC = _build_heuristic()
+
+
+def evaluate(board):
+    """
+    Returns:
+        float: Heuristic value of a board: its four rows and four columns.
+    """
+    h = ROW_HEURISTIC
+    columns = transpose(board)
+    return (h[board & 0xFFFF] + h[(board >> 16) & 0xFFFF] + h[(board >> 32) & 0xFFFF] +
+            h[board >> 48] + h[columns & 0xFFFF] + h[(columns >> 16) & 0xFFFF] +
+            h[(columns >> 32) & 0xFFFF] + h[columns >> 48])
+
+
+def search_depth(board):
+    """
+    Chooses how many moves to search: few while the board is open, more as
+    it fills and each move matters more and has fewer spawns to average.
+    Returns:
+        int: Depth between MIN_DEPTH and MAX_DEPTH.
+    """
+    empty = count_empty(board)
+    if empty >= 8:
+        return MIN_DEPTH
+    if empty >= 4:
+        return MIN_DEPTH + 1
+    return MAX_DEPTH
+
+
+class Search:
+    """
+    One expectimax search with its own transposition table.
+    Attributes:
+        table (dict): Board mapped to (depth searched, value) of its chance
+            node; leaves are kept with depth 0.
+        nodes (int): Chance nodes searched, hits not included.
+    """
+    __slots__ = ('table', 'nodes')
+
+    def __init__(self):
+        self.table = {}
+        self.nodes = 0
+
+    def chance(self, board, depth, prob):
+        """
+        Expected value of a board after a move, before its new tile.
+        Parameters:
+            board (int): Packed board.
+            depth (int): Moves left to search.
+            prob (float): Probability of reaching this board.
+        Returns:
+            float: Expected heuristic value.
+        """
+        known = self.table.get(board)
+        if depth <= 0 or prob < PROB_CUTOFF:
+            if known is None:
+                known = self.table[board] = (0, evaluate(board))
+            return known[1]
+        if known is not None and known[0] >= depth:
+            return known[1]
+        self.nodes += 1
+        shifts = [shift for shift in range(0, 64, 4) if not (board >> shift) & 0xF]
+        share = prob / len(shifts)  # A move always leaves an empty cell
+        total = 0.0
+        for shift in shifts:
+            for exponent, p in SPAWNS:
+                total += p * self.best(board | exponent << shift, depth, share * p)
+        value = total / len(shifts)
+        self.table[board] = (depth, value)
+        return value
+
+    def best(self, board, depth, prob):
+        """
+        Value of the best move from a board with its new tile placed.
+        Returns:
+            float: Best expected value, 0 when no move is possible.
+        """
+        # The four moves from the row tables, transposing the board only once
+        # for up and down
+        r0, r1, r2, r3 = (board & 0xFFFF, (board >> 16) & 0xFFFF,
+                          (board >> 32) & 0xFFFF, board >> 48)
+        columns = transpose(board)
+        c0, c1, c2, c3 = (columns & 0xFFFF, (columns >> 16) & 0xFFFF,
+                          (columns >> 32) & 0xFFFF, columns >> 48)
+        left, right = ROW_LEFT, ROW_RIGHT
+        value = 0.0
+        depth -= 1
+        for moved in (left[r0] | left[r1] << 16 | left[r2] << 32 | left[r3] << 48,
+                      right[r0] | right[r1] << 16 | right[r2] << 32 | right[r3] << 48,
+                      transpose(left[c0] | left[c1] << 16 | left[c2] << 32 | left[c3] << 48),
+                      transpose(right[c0] | right[c1] << 16 | right[c2] << 32 | right[c3] << 48)):
+            if moved != board:
+                moved = self.chance(moved, depth, prob)
+                if moved > value:
+                    value = moved
+        return value
+
+
+def move_value(board, depth):
+    """
+    Searches one root move in a fresh search; run in the worker processes.
+    Parameters:
+        board (int): Board after the move, before its new tile.
+        depth (int): Moves left to search after it.
+    Returns:
+        float: Expected value of the move.
+    """
+    return Search().chance(board, depth, 1.0)
+
+
+def best_move(board, depth=None, pool=None):
+    """
+    Chooses the move with the highest expected value.
+    Parameters:
+        board (int): Packed board.
+        depth (int): Moves to search, None to choose from the empty cells.
+        pool (concurrent.futures.Executor): Pool searching the four root
+            moves in parallel, None to search them here one after another.
+    Returns:
+        int: LEFT, RIGHT, UP or DOWN, or None when no move is possible.
+    """
+    depth = search_depth(board) if depth is None else depth
+    moves = [(direction, MOVES[direction](board)[0]) for direction in DIRECTIONS]
+    moves = [(direction, moved) for direction, moved in moves if moved != board]
+    if not moves:
+        return None
+    if pool is None:
+        search = Search()  # Root moves often reach the same boards, so share the table
+        values = [search.chance(moved, depth - 1, 1.0) for _, moved in moves]
+    else:
+        values = list(pool.map(move_value, [moved for _, moved in moves],
+                               [depth - 1] * len(moves)))
+    return moves[values.index(max(values))][0]
+
+
+def expectimax_policy(game, depth=None):
+    """
+    Returns:
+        int: The move best_move chooses for a game of game_2048.
+    """
+    direction = best_move(game.board, depth)
+    return DIRECTIONS[0] if direction is None else direction
+
+
+def play_game(seed, depth=None):
+    """
+    Plays one game with the expectimax player.
+    Parameters:
+        seed (int): Seed of the game's tiles.
+        depth (int): Search depth, None for the adaptive depth.
+    Returns:
+        dict: Seed, score, largest tile, moves, seconds and move history
+            of the game.
+    """
+    start = time.perf_counter()
+    game = play(lambda g: expectimax_policy(g, depth), seed)
+    return {'seed': seed, 'score': game.score, 'max_tile': game.max_tile,
+            'moves': game.moves, 'seconds': time.perf_counter() - start,
+            'history': bytes(game.history)}
+
+
+def play_games(games, seed=0, depth=None, workers=None):
+    """
+    Plays many games across a process pool, one game per task.
+    Parameters:
+        games (int): Number of games.
+        seed (int): Seed of the first game; game n uses seed + n.
+        depth (int): Search depth, None for the adaptive depth.
+        workers (int): Worker processes, None for one per core.
+    Returns:
+        list: Result of play_game for each game, in seed order.
+    """
+    from concurrent.futures import ProcessPoolExecutor  # For playing games in parallel
+    seeds = range(seed, seed + games)
+    if workers == 1:
+        return [play_game(s, depth) for s in seeds]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(play_game, seeds, [depth] * games))
+
+
+def summary(results, seconds):
+    """
+    Prints the win rate, scores and largest tiles of a batch of games.
+    """
+    moves = sum(r['moves'] for r in results)
+    wins = sum(r['max_tile'] >= 2048 for r in results)
+    print(f"{len(results)} games in {seconds:.1f} s, {moves / seconds:.0f} moves/s")
+    print(f"Reached 2048: {wins} ({100 * wins / len(results):.1f}%)")
+    print(f"Average score: {sum(r['score'] for r in results) / len(results):.0f}")
+    for tile, count in sorted(Counter(r['max_tile'] for r in results).items()):
+        print(f"  largest tile {tile:5d}: {count}")
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="2048 expectimax player")
+    parser.add_argument('--games', type=int, default=os.cpu_count() or 1,
+                        help="number of games to play")
+    parser.add_argument('--seed', type=seed_option, default=0,
+                        help="seed of the first game, 0 to 2**64 - 1")
+    parser.add_argument('--depth', type=int, help="search depth; adapts to the board if omitted")
+    parser.add_argument('--workers', type=int, help="worker processes, one per core if omitted")
+    parser.add_argument('--record', metavar='FILE', help="append the games to a recording file")
+    args = parser.parse_args(argv)
+    if args.games < 1:  # summary divides by the number of games
+        parser.error("--games must be at least 1")
+    if args.seed + args.games > SEED_LIMIT:  # Game n uses seed + n
+        parser.error("--seed plus --games must not pass 2**64")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.perf_counter()
+    results = play_games(args.games, args.seed, args.depth, args.workers)
+    summary(results, time.perf_counter() - start)
+    if args.record:
+        from recording_2048 import GameRecord, append_games
+        append_games(args.record, (GameRecord(r['seed'], r['history']) for r in results))
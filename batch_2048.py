@@ -0,0 +1,254 @@
+'''
+Program: Batched 2048 environment
+Author: Prashanth Reddy Loka
+Description: Steps thousands of 2048 games at once with NumPy. The boards
+        are one (N, 4, 4) array of tile exponents (0 empty, 1 for 2, ... 11
+        for 2048), and step(actions) moves every board with the row tables
+        of bitboard_2048, adds the scores, places the new tiles and detects
+        wins and lost games with array operations only. Each game has its
+        own random stream (SplitMix64 kept in a uint64 array) started from
+        its seed, so a game plays out the same whatever batch it runs in.
+        Tiles are placed like add_new_tile: a uniform empty cell in row-major
+        order, then a 2 (90%) or a 4 (10%).
+            env = BatchEnv(10000, seed=0)
+            moved, reward, done = env.step(actions)
+Revisions: 00 - Vectorized step, spawns and game over with per-game seeds
+           01 - Seeds outside 0 to 2**64 - 1 are rejected instead of wrapping
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+import time  # For the steps per second
+import numpy as np  # For the board arrays
+from bitboard_2048 import (DOWN, GRID_SIZE, LEFT, ROW_LEFT, ROW_RIGHT, ROW_SCORE, UP,
+                           WIN_EXPONENT)
+from game_2048 import SEED_LIMIT, START_TILES, check_seed, seed_option
+
+TWO_CHANCE = 0.9  # Chance that a new tile is a 2
+# Row tables of bitboard_2048 as arrays indexed by a packed row
+LEFT_TABLE = np.array(ROW_LEFT, dtype=np.uint16)
+RIGHT_TABLE = np.array(ROW_RIGHT, dtype=np.uint16)
+SCORE_TABLE = np.array(ROW_SCORE, dtype=np.int64)
+NIBBLE_SHIFTS = np.arange(0, 16, 4, dtype=np.uint16)  # Shift of each cell of a packed row
+# SplitMix64 constants
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(z):
+    """
+    Returns:
+        numpy.ndarray: SplitMix64 output of each uint64 state.
+    """
+    z = (z ^ (z >> np.uint64(30))) * MIX1
+    z = (z ^ (z >> np.uint64(27))) * MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+def pack_rows(boards):
+    """
+    Parameters:
+        boards (numpy.ndarray): (..., 4) exponents.
+    Returns:
+        numpy.ndarray: uint16 packed row of every row, cell 0 in the low nibble.
+    """
+    return np.bitwise_or.reduce(boards.astype(np.uint16) << NIBBLE_SHIFTS, axis=-1)
+
+
+def unpack_rows(rows):
+    """
+    Returns:
+        numpy.ndarray: (..., 4) uint8 exponents of packed rows.
+    """
+    return ((rows[..., None] >> NIBBLE_SHIFTS) & 0xF).astype(np.uint8)
+
+
+def slide(boards, actions):
+    """
+    Moves every board one way, without placing new tiles.
+    Parameters:
+        boards (numpy.ndarray): (N, 4, 4) exponents.
+        actions (numpy.ndarray): (N,) LEFT, RIGHT, UP or DOWN per board.
+    Returns:
+        tuple: (moved boards, score gained by each).
+    """
+    vertical = (actions == UP) | (actions == DOWN)
+    rows = np.where(vertical[:, None, None], boards.transpose(0, 2, 1), boards)
+    packed = pack_rows(rows)
+    towards_start = ((actions == LEFT) | (actions == UP))[:, None]
+    moved = unpack_rows(np.where(towards_start, LEFT_TABLE[packed], RIGHT_TABLE[packed]))
+    moved = np.where(vertical[:, None, None], moved.transpose(0, 2, 1), moved)
+    return moved, SCORE_TABLE[packed].sum(axis=1)
+
+
+def can_move(boards):
+    """
+    Returns:
+        numpy.ndarray: True for boards with an empty cell or two equal neighbours.
+    """
+    return ((boards == 0).any(axis=(1, 2)) |
+            (boards[:, :, 1:] == boards[:, :, :-1]).any(axis=(1, 2)) |
+            (boards[:, 1:, :] == boards[:, :-1, :]).any(axis=(1, 2)))
+
+
+class BatchEnv:
+    """
+    N games of 2048 stepped together.
+    Attributes:
+        boards (numpy.ndarray): (N, 4, 4) uint8 tile exponents.
+        scores (numpy.ndarray): (N,) score of each game.
+        moves (numpy.ndarray): (N,) moves that changed each board.
+        win, game_over (numpy.ndarray): (N,) flags of each game.
+        seeds (numpy.ndarray): (N,) uint64 seed of each game.
+        state (numpy.ndarray): (N,) uint64 random stream of each game.
+    """
+    __slots__ = ('boards', 'scores', 'moves', 'win', 'game_over', 'state', 'seeds')
+
+    def __init__(self, count, seed=0):
+        """
+        Parameters:
+            count (int): Number of games.
+            seed: int for seeds seed, seed + 1, ...; or one seed per game.
+                Every seed must be between 0 and 2**64 - 1.
+        """
+        if np.ndim(seed) == 0:
+            if check_seed(int(seed)) + count > SEED_LIMIT:
+                raise ValueError(f"Seeds {seed} to {seed} + {count - 1} pass 2**64 - 1")
+            seeds = np.uint64(seed) + np.arange(count, dtype=np.uint64)
+        else:
+            for one in seed:  # A negative or too large seed would wrap in uint64
+                check_seed(int(one))
+            seeds = np.asarray(seed, dtype=np.uint64)
+        self.seeds = seeds
+        self.boards = np.zeros((count, GRID_SIZE, GRID_SIZE), dtype=np.uint8)
+        self.scores = np.zeros(count, dtype=np.int64)
+        self.moves = np.zeros(count, dtype=np.int64)
+        self.win = np.zeros(count, dtype=bool)
+        self.game_over = np.zeros(count, dtype=bool)
+        with np.errstate(over='ignore'):
+            self.state = _mix(seeds + GOLDEN)
+        self.reset()
+
+    def __len__(self):
+        return len(self.boards)
+
+    @property
+    def done(self):
+        """
+        numpy.ndarray: True for games that were won or lost.
+        """
+        return self.win | self.game_over
+
+    def values(self):
+        """
+        Returns:
+            numpy.ndarray: (N, 4, 4) tile values, 0 for empty.
+        """
+        return np.where(self.boards > 0, 1 << self.boards.astype(np.int64), 0)
+
+    def _uniform(self, games):
+        """
+        Advances the random streams of some games.
+        Returns:
+            numpy.ndarray: One float in [0, 1) per game.
+        """
+        with np.errstate(over='ignore'):
+            self.state[games] += GOLDEN
+            return (_mix(self.state[games]) >> np.uint64(11)) * (1.0 / 2 ** 53)
+
+    def _spawn(self, games):
+        """
+        Places one new tile on each of the given games' boards.
+        Parameters:
+            games (numpy.ndarray): Indexes of the games, each with an empty cell.
+        """
+        cells = self.boards[games].reshape(len(games), GRID_SIZE * GRID_SIZE)
+        empty = cells == 0
+        count = empty.sum(axis=1)
+        pick = (self._uniform(games) * count).astype(np.int64)  # Which empty cell, row-major
+        cell = np.argmax(empty & (np.cumsum(empty, axis=1) == pick[:, None] + 1), axis=1)
+        tile = np.where(self._uniform(games) < TWO_CHANCE, 1, 2).astype(np.uint8)
+        cells[np.arange(len(games)), cell] = tile
+        self.boards[games] = cells.reshape(-1, GRID_SIZE, GRID_SIZE)
+
+    def reset(self, games=None):
+        """
+        Starts new games with two tiles; each game's random stream carries
+        on, so a reset game is not a replay of the last one.
+        Parameters:
+            games: Indexes or boolean mask of the games to reset, None for all.
+        """
+        games = np.arange(len(self)) if games is None else np.asarray(games)
+        if games.dtype == bool:
+            games = np.flatnonzero(games)
+        self.boards[games] = 0
+        self.scores[games] = self.moves[games] = 0
+        self.win[games] = self.game_over[games] = False
+        for _ in range(START_TILES):
+            self._spawn(games)
+
+    def step(self, actions):
+        """
+        Plays one move in every game; games that already ended stay as they are.
+        Parameters:
+            actions (numpy.ndarray): (N,) LEFT, RIGHT, UP or DOWN per game.
+        Returns:
+            tuple: (moved, reward, done) arrays: whether each board changed,
+                the score each move gained and whether each game has ended.
+        """
+        actions = np.asarray(actions)
+        live = ~(self.win | self.game_over)
+        boards, reward = slide(self.boards, actions)
+        moved = live & (boards != self.boards).any(axis=(1, 2))
+        reward = np.where(moved, reward, 0)
+        self.boards[moved] = boards[moved]
+        games = np.flatnonzero(moved)
+        self._spawn(games)
+        self.scores += reward
+        self.moves += moved
+        after = self.boards[games]
+        self.win[games] = (after == WIN_EXPONENT).any(axis=(1, 2))
+        self.game_over[games] = ~can_move(after)
+        return moved, reward, self.win | self.game_over
+
+    def max_tiles(self):
+        """
+        Returns:
+            numpy.ndarray: (N,) value of the largest tile of each game.
+        """
+        return 1 << self.boards.max(axis=(1, 2)).astype(np.int64)
+
+
+def benchmark(count, steps, seed=0):
+    """
+    Steps count random-move games steps times, resetting finished games.
+    Returns:
+        float: Game steps per second.
+    """
+    env = BatchEnv(count, seed)
+    actions = np.random.default_rng(seed).integers(0, 4, (steps, count))
+    start = time.perf_counter()
+    for n in range(steps):
+        done = env.step(actions[n])[2]
+        if done.any():
+            env.reset(done)
+    return count * steps / (time.perf_counter() - start)
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Batched 2048 environment benchmark")
+    parser.add_argument('--games', type=int, default=10000, help="games stepped together")
+    parser.add_argument('--steps', type=int, default=200, help="steps of every game")
+    parser.add_argument('--seed', type=seed_option, default=0,
+                        help="seed of the first game, 0 to 2**64 - 1")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{benchmark(args.games, args.steps, args.seed):.0f} steps/s")
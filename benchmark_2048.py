@@ -0,0 +1,261 @@
+'''
+Program: 2048 engine and renderer benchmark
+Author: Prashanth Reddy Loka
+Description: Measures how fast the 2048 game runs. The four moves,
+        check_game_over, check_win and add_new_tile are timed over seeded
+        random boards and over late-game boards with few empty cells; whole
+        random-play games, batched steps and the expectimax search are timed
+        per game, step and move; and the pygame renderer is timed per frame,
+        fully redrawn and incremental, under the dummy SDL video driver. The
+        time per operation is saved as a baseline JSON file that later runs
+        are compared against:
+            python benchmark_2048.py --save base.json
+            python benchmark_2048.py --compare base.json
+Revisions: 00 - Engine, game, search and render timings, baseline and compare mode
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+import importlib.util  # For loading the pygame front end, whose file name starts with a digit
+import json  # For the baseline file
+import os  # For the dummy video driver
+import platform  # For describing the machine in the baseline
+import random  # For the seeded boards
+import sys  # For the exit status of a comparison
+import time  # For timing each operation
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Frames are drawn off screen
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import numpy as np  # For the batched environment's actions
+from bitboard_2048 import (DIRECTIONS, MOVES, add_new_tile, check_game_over, check_win,
+                           count_empty, to_grid)
+from game_2048 import SEED_LIMIT, Game, play, random_policy, seed_option
+
+BOARDS = 1000  # Boards in each board set
+BATCH_GAMES = 10000  # Games of the batched environment
+LATE_EMPTY = 3  # Late-game boards have at most this many empty cells
+TOLERANCE = 0.25  # Slowdown over the baseline reported as a regression
+VIEW_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2048_game_python.py")
+
+
+def random_boards(count, seed=0):
+    """
+    Returns:
+        list: count packed boards with random tiles up to 2048 and about
+            40% empty cells.
+    """
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = 0
+        for shift in range(0, 64, 4):
+            if rng.random() >= 0.4:
+                board |= rng.randint(1, 11) << shift
+        boards.append(board)
+    return boards
+
+
+def late_boards(count, seed=0):
+    """
+    Returns:
+        list: count packed boards of random-play games once they have at
+            most LATE_EMPTY empty cells.
+    """
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        game = Game(rng.getrandbits(32))
+        while not game.done:
+            if count_empty(game.board) <= LATE_EMPTY and rng.random() < 0.2:
+                boards.append(game.board)
+            game.step(rng.choice(DIRECTIONS))
+    return boards[:count]
+
+
+def _timed(results, name, repeat, operations, function, *args):
+    """
+    Runs a benchmark repeat times and keeps its best time per operation.
+    Parameters:
+        results (dict): Name mapped to seconds per operation.
+        name (str): Benchmark name.
+        repeat (int): Runs; the best is kept.
+        operations (int): Operations one run performs.
+        function: Runs the benchmark once.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    results[name] = best / operations
+
+
+def _apply(function, boards):
+    for board in boards:
+        function(board)
+
+
+def _spawn(boards, seed):
+    rng = random.Random(seed)
+    for board in boards:
+        add_new_tile(board, rng)
+
+
+def engine(results, repeat, seed):
+    """
+    Times the moves and the board checks on random and late-game boards.
+    """
+    for label, boards in (('random', random_boards(BOARDS, seed)),
+                          ('late', late_boards(BOARDS, seed))):
+        for function in MOVES:
+            _timed(results, f"{function.__name__} {label}", repeat, len(boards),
+                   _apply, function, boards)
+        for function in (check_game_over, check_win):
+            _timed(results, f"{function.__name__} {label}", repeat, len(boards),
+                   _apply, function, boards)
+        _timed(results, f"add_new_tile {label}", repeat, len(boards), _spawn, boards, seed)
+
+
+def games(results, repeat, seed, count):
+    """
+    Times whole random-play games, batched steps and expectimax moves.
+    """
+    moves = []
+
+    def random_games():
+        random.seed(seed)  # random_policy draws from the random module: same games every run
+        moves.append(sum(play(random_policy, seed + n).moves for n in range(count)))
+    _timed(results, 'random game', repeat, count, random_games)
+    results['random game moves'] = moves[-1] / count  # Kept to explain a change in game time
+
+    from batch_2048 import BatchEnv
+    env = BatchEnv(BATCH_GAMES, seed)
+    actions = np.random.default_rng(seed).integers(0, 4, (20, len(env)))
+
+    def batch_steps():
+        for step in actions:
+            done = env.step(step)[2]
+            if done.any():
+                env.reset(done)
+    _timed(results, 'batch step', repeat, actions.size, batch_steps)
+
+    from ai_2048 import best_move
+    boards = late_boards(20, seed)  # The boards where the search goes deepest
+    _timed(results, 'expectimax move late', repeat, len(boards), _apply, best_move, boards)
+
+
+def render(results, repeat, seed, frames):
+    """
+    Times full and incremental frames of the pygame renderer off screen.
+    """
+    spec = importlib.util.spec_from_file_location('game_view', VIEW_FILE)
+    view = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(view)
+    screen, font, small_font = view.open_window()
+    renderer = view.Renderer(screen, font, small_font)
+    game = Game(seed)
+    rng = random.Random(seed)
+    states = []  # (grid, score) of a random game, replayed into each frame
+    while len(states) < frames:
+        if game.done:
+            game.reset()
+        game.step(rng.choice(DIRECTIONS))
+        states.append((to_grid(game.board), game.score))
+
+    def full_frames():
+        for grid, score in states:
+            renderer.shown = None  # Draw the whole window, as every frame did before
+            renderer.draw(grid, score, score)
+
+    def incremental_frames():
+        for grid, score in states:
+            renderer.draw(grid, score, score)
+    _timed(results, 'render full frame', repeat, frames, full_frames)
+    _timed(results, 'render frame', repeat, frames, incremental_frames)
+    view.pygame.quit()
+
+
+def run(repeat=3, seed=0, game_count=200, frames=500):
+    """
+    Runs every benchmark.
+    Returns:
+        dict: Benchmark report: machine description and seconds per operation.
+    """
+    import pygame  # For the version in the report
+    results = {}
+    engine(results, repeat, seed)
+    games(results, repeat, seed, game_count)
+    render(results, repeat, seed, frames)
+    for name, seconds in results.items():
+        if name.endswith(' moves'):
+            print(f"  {name:28s} {seconds:12.1f}")
+        else:
+            print(f"  {name:28s} {seconds * 1e6:12.3f} us {1 / seconds:14.0f}/s")
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'pygame': pygame.version.ver, 'machine': platform.machine(),
+            'processor': platform.processor(), 'repeat': repeat, 'seed': seed,
+            'results': results}
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """
+    Prints each operation time against the baseline.
+    Parameters:
+        report (dict): Results of this run.
+        baseline (dict): Results of an earlier run.
+        tolerance (float): Allowed slowdown, 0.25 for 25 %.
+    Returns:
+        list: (name, ratio) of every operation slower than allowed.
+    """
+    slower = []
+    before = baseline['results']
+    for name, seconds in report['results'].items():
+        if name not in before or name.endswith(' moves'):
+            continue
+        ratio = seconds / before[name] if before[name] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  SLOWER'
+            slower.append((name, ratio))
+        elif ratio < 1 / (1 + tolerance):
+            flag = '  faster'
+        print(f"  {name:28s} {before[name] * 1e6:12.3f} -> {seconds * 1e6:12.3f} us"
+              f"  x{ratio:.2f}{flag}")
+    return slower
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="2048 engine and renderer benchmark")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs of each benchmark; the best time is kept")
+    parser.add_argument('--seed', type=seed_option, default=0,
+                        help="seed of the boards and games, 0 to 2**64 - 1")
+    parser.add_argument('--games', type=int, default=200, help="random-play games timed")
+    parser.add_argument('--frames', type=int, default=500, help="frames rendered")
+    parser.add_argument('--save', metavar='JSON', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='JSON', help="baseline to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="allowed slowdown before an operation is reported, 0.25 for 25%%")
+    args = parser.parse_args(argv)
+    if args.seed + max(args.games, BATCH_GAMES) > SEED_LIMIT:  # Games use seed, seed + 1, ...
+        parser.error("--seed is too close to 2**64 for the games played")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args.repeat, args.seed, args.games, args.frames)
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(report, out, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as b:
+            slower = compare(report, json.load(b), args.tolerance)
+        if slower:
+            print(f"{len(slower)} operations slower than the baseline")
+            sys.exit(1)
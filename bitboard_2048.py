@@ -0,0 +1,238 @@
+'''
+Program: 2048 bitboard engine
+Author: Prashanth Reddy Loka
+Description: The rules of 2048_game_python.py on a packed board. The 4x4
+        grid is one 64-bit integer holding a 4-bit exponent per tile (0 for
+        an empty cell, 1 for 2, 2 for 4, ... 11 for 2048): row i is bits
+        16*i to 16*i+15 and column j the j-th nibble of its row. Every
+        possible row has its left and right move and score precomputed in
+        65536-entry tables, and up and down moves work on the transposed
+        board, so a move is four table lookups. Merging follows the game
+        exactly: tiles slide, each pair merges once, and no tile merges
+        twice in one move. Tiles are capped at 32768, one nibble.
+Revisions: 00 - Packed board, row move tables and the game rules
+'''
+# Import necessary libraries
+import random  # For placing new tiles
+
+GRID_SIZE = 4  # Cells per side
+LEFT, RIGHT, UP, DOWN = range(4)  # Move directions
+DIRECTIONS = (LEFT, RIGHT, UP, DOWN)
+WIN_EXPONENT = 11  # 2 ** 11 == 2048
+MAX_EXPONENT = 15  # Largest exponent a nibble holds
+ROW_MASK = 0xFFFF  # One row of the board
+LOW_BITS = 0x1111111111111111  # Lowest bit of every nibble
+
+
+def _slide_row(cells):
+    """
+    Moves one row to the left the way move_left of the game does.
+    Parameters:
+        cells (list): Exponents of the four cells, 0 for empty.
+    Returns:
+        tuple: (new cells, score gained).
+    """
+    new_row = [cell for cell in cells if cell != 0]
+    new_row += [0] * (GRID_SIZE - len(new_row))
+    gained = 0
+    for j in range(GRID_SIZE - 1):
+        if new_row[j] == new_row[j + 1] and new_row[j] != 0:
+            new_row[j] = min(new_row[j] + 1, MAX_EXPONENT)
+            gained += 1 << new_row[j]
+            new_row[j + 1] = 0
+    new_row = [cell for cell in new_row if cell != 0]
+    return new_row + [0] * (GRID_SIZE - len(new_row)), gained
+
+
+def _pack_row(cells):
+    return cells[0] | cells[1] << 4 | cells[2] << 8 | cells[3] << 12
+
+
+def _reverse_row(row):
+    return ((row >> 12) | ((row >> 4) & 0x00F0) | ((row << 4) & 0x0F00) |
+            ((row << 12) & 0xF000))
+
+
+def _build_tables():
+    """
+    Returns:
+        tuple: (left, right, score) lists indexed by a packed row: the row
+            after a left move, after a right move, and the score of either.
+    """
+    left, right, score = [0] * 65536, [0] * 65536, [0] * 65536
+    for row in range(65536):
+        cells = [(row >> (4 * j)) & 0xF for j in range(GRID_SIZE)]
+        moved, gained = _slide_row(cells)
+        left[row] = _pack_row(moved)
+        score[row] = gained
+    for row in range(65536):
+        # A right move is a left move of the mirrored row, mirrored back
+        right[row] = _reverse_row(left[_reverse_row(row)])
+    return left, right, score
+
+
+ROW_LEFT, ROW_RIGHT, ROW_SCORE = _build_tables()
+
+
+def transpose(board):
+    """
+    Returns:
+        int: The board with rows and columns swapped.
+    """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _move_rows(board, table):
+    """
+    Returns:
+        tuple: (board with each row replaced from the table, score gained).
+    """
+    r0, r1 = board & ROW_MASK, (board >> 16) & ROW_MASK
+    r2, r3 = (board >> 32) & ROW_MASK, board >> 48
+    return ((table[r0] | table[r1] << 16 | table[r2] << 32 | table[r3] << 48),
+            ROW_SCORE[r0] + ROW_SCORE[r1] + ROW_SCORE[r2] + ROW_SCORE[r3])
+
+
+def move_left(board):
+    """
+    Returns:
+        tuple: (new board, score gained).
+    """
+    return _move_rows(board, ROW_LEFT)
+
+
+def move_right(board):
+    """
+    Returns:
+        tuple: (new board, score gained).
+    """
+    return _move_rows(board, ROW_RIGHT)
+
+
+def move_up(board):
+    """
+    Returns:
+        tuple: (new board, score gained).
+    """
+    moved, gained = _move_rows(transpose(board), ROW_LEFT)
+    return transpose(moved), gained
+
+
+def move_down(board):
+    """
+    Returns:
+        tuple: (new board, score gained).
+    """
+    moved, gained = _move_rows(transpose(board), ROW_RIGHT)
+    return transpose(moved), gained
+
+
+MOVES = (move_left, move_right, move_up, move_down)  # Indexed by direction
+
+
+def move(board, direction):
+    """
+    Parameters:
+        board (int): Packed board.
+        direction (int): LEFT, RIGHT, UP or DOWN.
+    Returns:
+        tuple: (new board, score gained); the board is unchanged when
+            nothing can move that way.
+    """
+    return MOVES[direction](board)
+
+
+def empty_cells(board):
+    """
+    Returns:
+        list: (i, j) of every empty cell, in row-major order like the game.
+    """
+    return [(n >> 2, n & 3) for n in range(16) if not (board >> (4 * n)) & 0xF]
+
+
+def count_empty(board):
+    """
+    Returns:
+        int: Number of empty cells.
+    """
+    filled = board | (board >> 1)
+    filled |= filled >> 2  # Lowest bit of each nibble set when the cell holds a tile
+    return 16 - bin(filled & LOW_BITS).count('1')
+
+
+def add_new_tile(board, rng=random):
+    """
+    Places a 2 (90%) or a 4 (10%) on a random empty cell, drawing from the
+    random source in the same order as the game: choice, then random.
+    Parameters:
+        board (int): Packed board.
+        rng: random module or random.Random instance.
+    Returns:
+        int: The new board, unchanged when it is full.
+    """
+    empty = empty_cells(board)
+    if empty:
+        i, j = rng.choice(empty)
+        board |= (1 if rng.random() < 0.9 else 2) << (4 * (GRID_SIZE * i + j))
+    return board
+
+
+def check_game_over(board):
+    """
+    Returns:
+        bool: True when the board is full and no two neighbours match.
+    """
+    return (count_empty(board) == 0 and move_left(board)[0] == board and
+            move_up(board)[0] == board)
+
+
+def check_win(board):
+    """
+    Returns:
+        bool: True when a 2048 tile is on the board.
+    """
+    matched = board ^ (WIN_EXPONENT * LOW_BITS)  # Zero nibbles where a tile is 2048
+    matched |= matched >> 1
+    matched |= matched >> 2
+    return matched & LOW_BITS != LOW_BITS
+
+
+def max_exponent(board):
+    """
+    Returns:
+        int: Exponent of the largest tile, 0 for an empty board.
+    """
+    return max((board >> (4 * n)) & 0xF for n in range(16))
+
+
+def to_board(grid):
+    """
+    Packs a grid of tile values such as the game's grid.
+    Parameters:
+        grid (list): Rows of tile values, 0 for empty.
+    Returns:
+        int: Packed board.
+    """
+    board = 0
+    for i, row in enumerate(grid):
+        for j, value in enumerate(row):
+            if value:
+                board |= (value.bit_length() - 1) << (4 * (GRID_SIZE * i + j))
+    return board
+
+
+def to_grid(board):
+    """
+    Returns:
+        list: Rows of tile values, 0 for empty, like the game's grid.
+    """
+    return [[(1 << e) if e else 0 for e in ((board >> (16 * i + 4 * j)) & 0xF
+                                           for j in range(GRID_SIZE))]
+            for i in range(GRID_SIZE)]
@@ -0,0 +1,298 @@
+'''
+Program: Earthquake pipeline benchmark
+Author: Prashanth Reddy Loka
+Description: Measures how the earthquake pipeline scales. Synthetic catalogs
+        in the earthquakesF23.csv layout, including invalid dates like the
+        ISO timestamps of the real file, are generated at 10^4 to 10^7 rows.
+        Loading, the first query on a freshly loaded catalog (which builds
+        the indexes it uses), the four range filters on built indexes, the
+        per-year aggregation, longitude binning, the nearest-city join, the
+        aftershock sequences and headless plot rendering are timed on each,
+        and the results are saved as a baseline JSON file that later runs
+        are compared against.
+Revisions: 00 - Synthetic catalogs, stage timings, baseline and compare mode
+           01 - The index build of the first query is timed as its own stage
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+import json  # For the baseline file
+import os  # For the synthetic catalog folder
+import platform  # For describing the machine in the baseline
+import sys  # For the exit status of a comparison
+import tempfile  # For the rendered plot files
+import time  # For timing each stage
+import matplotlib  # For selecting the headless backend
+matplotlib.use('Agg')  # Plots are rendered to files only
+import numpy as np  # For generating the synthetic columns
+from earthquake_cache import cached_catalog, cached_cities
+from earthquake_catalog import CITIES_FILE, Axis, find_mainshocks, load_catalog
+from EarthquakeDatavisualization import analysis_plots, render_plot, to_range
+
+BENCH_DIR = ".earthquake_benchmark"  # Folder of the generated catalogs
+SIZES = (10 ** 4, 10 ** 5, 10 ** 6)  # Default catalog sizes; 10 ** 7 on request
+WRITE_ROWS = 100000  # Synthetic rows formatted at a time
+INVALID_DATES = 0.001  # Share of rows with a date that is_valid_date rejects
+TOLERANCE = 0.25  # Slowdown over the baseline reported as a regression
+MIN_SECONDS = 0.005  # Stages faster than this in the baseline are too noisy to compare
+FIRST_DAY, LAST_DAY = to_range('01/02/1965', '12/30/2016')  # Day numbers of the real catalog
+# Query run on every catalog, in the interactive stage order
+QUERY = (('lat', (-60, 60)), ('lng', (-150, 150)),
+         ('day', to_range('01/01/1970', '12/31/2010')), ('mag', (5.5, 8)))
+# Category columns drawn with the frequencies of the real catalog
+TYPES = {'Earthquake': 0.992, 'Nuclear Explosion': 0.0075, 'Explosion': 0.0003,
+         'Rock Burst': 0.0002}
+MAG_TYPES = {'MW': 0.33, 'MWC': 0.24, 'MB': 0.16, 'MWB': 0.105, 'MWW': 0.085,
+             'MS': 0.073, 'ML': 0.0035, 'MWR': 0.0015, 'MD': 0.001, 'MH': 0.001}
+
+
+def _date_strings(first, last):
+    """
+    Returns:
+        numpy.ndarray: 'mm/dd/yyyy' string of every day number from first to last.
+    """
+    iso = np.datetime_as_string(np.arange(first, last + 1).astype('datetime64[D]'))
+    return np.array([f"{d[5:7]}/{d[8:10]}/{d[:4]}" for d in iso])
+
+
+def _choice(rng, weights, rows):
+    """
+    Returns:
+        numpy.ndarray: rows names drawn with the given weights.
+    """
+    names = np.array(list(weights))
+    p = np.array(list(weights.values()))
+    return names[rng.choice(len(names), rows, p=p / p.sum())]
+
+
+def _synthetic_rows(rng, rows, dates):
+    """
+    Formats one block of synthetic catalog rows.
+    Parameters:
+        rng (numpy.random.Generator): Random source.
+        rows (int): Number of rows.
+        dates (numpy.ndarray): Date string of each day number, from day 0 of
+            the catalog range.
+    Returns:
+        str: CSV lines of the block.
+    """
+    day = rng.integers(0, len(dates), rows)
+    seconds = rng.integers(0, 86400, rows)
+    times = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in seconds],
+                     dtype=object)
+    date = dates[day].astype(object)  # Object strings, so longer invalid dates fit
+    # Invalid dates: ISO timestamps as in the real file, and impossible days
+    bad = np.flatnonzero(rng.random(rows) < INVALID_DATES)
+    iso = np.datetime_as_string((day[bad] + FIRST_DAY).astype('datetime64[D]'))
+    date[bad] = [f"{d}T{t}.000Z" if n % 2 else f"02/30/{d[:4]}"
+                 for n, (d, t) in enumerate(zip(iso, times[bad]))]
+    times[bad[1::2]] = date[bad[1::2]]  # ISO rows repeat the timestamp in Time
+    # Events cluster along belts: a latitude band mixture with uniform spread
+    lat = np.clip(rng.normal(rng.choice([-20.0, 0.0, 15.0, 38.0], rows), 12), -77.08, 86.005)
+    lng = rng.uniform(-179.997, 179.998, rows)
+    depth = np.round(rng.exponential(70, rows), 1)
+    mag = np.round(np.minimum(5.5 + rng.exponential(0.45, rows), 9.1), 1)
+    columns = (date, times, np.round(lat, 3).astype(str), np.round(lng, 3).astype(str),
+               _choice(rng, TYPES, rows), depth.astype(str), mag.astype(str),
+               _choice(rng, MAG_TYPES, rows))
+    return ''.join(','.join(row) + '\n' for row in zip(*columns))
+
+
+def synthetic_catalog(rows, seed=0, folder=BENCH_DIR):
+    """
+    Writes a synthetic catalog in the earthquakesF23.csv layout, unless the
+    same size and seed was generated before.
+    Parameters:
+        rows (int): Number of records.
+        seed (int): Random seed; the same seed gives the same file.
+        folder (str): Folder the catalog is written to.
+    Returns:
+        str: Path of the CSV file.
+    """
+    path = os.path.join(folder, f"synthetic_{rows}_{seed}.csv")
+    if os.path.exists(path):
+        return path
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dates = _date_strings(int(FIRST_DAY), int(LAST_DAY))
+    partial = path + '.part'  # Renamed once complete, so a broken run is not reused
+    with open(partial, 'w', newline='') as out:
+        out.write("Date,Time,Latitude,Longitude,Type,Depth,Magnitude,Magnitude Type\n")
+        for start in range(0, rows, WRITE_ROWS):
+            out.write(_synthetic_rows(rng, min(WRITE_ROWS, rows - start), dates))
+    os.replace(partial, path)
+    return path
+
+
+def _timed(results, name, repeat, function, *args):
+    """
+    Runs a stage repeat times and keeps its best wall time.
+    Returns:
+        The result of the last run.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    results[name] = round(best, 6)
+    return value
+
+
+def _query(catalog):
+    """
+    Returns:
+        Selection: Records of a catalog inside every range of QUERY.
+    """
+    select = catalog.all()
+    for name, bounds in QUERY:
+        select = select.where(**{name: bounds})
+    return select
+
+
+def _timed_cold(results, name, repeat, path):
+    """
+    Runs QUERY on a freshly loaded catalog repeat times and keeps the best
+    wall time, so every run builds the indexes the query uses. The loading
+    itself is not timed.
+    Returns:
+        Catalog: The catalog of the last run, its indexes built.
+    """
+    best = None
+    for _ in range(repeat):
+        catalog = cached_catalog(path)  # A new Catalog, no index built yet
+        start = time.perf_counter()
+        _query(catalog)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    results[name] = round(best, 6)
+    return catalog
+
+
+def _render(select, folder):
+    """
+    Computes the plot data of a selection and saves every plot.
+    """
+    plots = analysis_plots(select)
+    for name, (plot, args) in plots.items():
+        render_plot(name, plot, args, os.path.join(folder, f"{name}.png"))
+
+
+def run_size(rows, cities, repeat=1, seed=0):
+    """
+    Times every pipeline stage on one synthetic catalog.
+    Parameters:
+        rows (int): Catalog size.
+        cities (CityTable): World cities table for the join.
+        repeat (int): Runs of each stage; the best time is kept.
+        seed (int): Seed of the synthetic catalog.
+    Returns:
+        dict: Stage name mapped to its best time in seconds, plus the
+            number of selected records.
+    """
+    path = synthetic_catalog(rows, seed)
+    results = {}
+    catalog = _timed(results, 'load csv', repeat, load_catalog, path)
+    cached_catalog(path)  # Writes the column cache
+    _timed(results, 'load cache', repeat, cached_catalog, path)
+    catalog = _timed_cold(results, 'index build', repeat, path)
+    select = catalog.all()
+    for name, bounds in QUERY:  # Each filter narrows the previous selection; indexes built
+        select = _timed(results, 'filter ' + name, repeat,
+                        lambda s=select, n=name, b=bounds: s.where(**{n: b}))
+    _timed(results, 'per-year aggregation', repeat,
+           lambda: (lambda g: (g.count(), g.mean('mag')))(select.group_by('year')))
+    _timed(results, 'longitude binning', repeat,
+           lambda: select.bins({'lng': Axis(-180, 180, 6)}).mean(empty=0))
+    _timed(results, 'nearest city', repeat, cities.nearest, select.lat, select.lng)
+    _timed(results, 'population within', repeat,
+           cities.population_within, select.lat, select.lng, 100)
+    _timed(results, 'sequences', repeat, find_mainshocks,
+           catalog.lat, catalog.lng, catalog.day, catalog.mag)
+    catalog.sequences()  # Kept on the catalog, so rendering times the plots only
+    with tempfile.TemporaryDirectory() as folder:
+        _timed(results, 'render', repeat, _render, select, folder)
+    results['selected'] = len(select)
+    return results
+
+
+def run(sizes=SIZES, repeat=1, seed=0):
+    """
+    Runs the benchmark on every catalog size.
+    Returns:
+        dict: Benchmark report: machine description and per-size results.
+    """
+    cities = cached_cities(CITIES_FILE)
+    cities.grid  # Built once here, so the first size does not pay for it
+    report = {'python': platform.python_version(), 'numpy': np.__version__,
+              'machine': platform.machine(), 'processor': platform.processor(),
+              'repeat': repeat, 'seed': seed, 'sizes': {}}
+    for rows in sizes:
+        print(f"{rows} rows...", flush=True)
+        report['sizes'][str(rows)] = results = run_size(rows, cities, repeat, seed)
+        for name, seconds in results.items():
+            if name != 'selected':
+                print(f"  {name:22s} {seconds * 1000:10.1f} ms")
+    return report
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """
+    Prints each stage time against the baseline.
+    Parameters:
+        report (dict): Results of this run.
+        baseline (dict): Results of an earlier run.
+        tolerance (float): Allowed slowdown, 0.25 for 25 %.
+    Returns:
+        list: (size, stage, ratio) of every stage slower than allowed.
+    """
+    slower = []
+    for size, results in report['sizes'].items():
+        before = baseline['sizes'].get(size)
+        if before is None:  # Size not in the baseline
+            continue
+        print(f"{size} rows:")
+        for name, seconds in results.items():
+            if name == 'selected' or name not in before:
+                continue
+            ratio = seconds / before[name] if before[name] else float('inf')
+            flag = ''
+            if before[name] >= MIN_SECONDS and ratio > 1 + tolerance:
+                flag = '  SLOWER'
+                slower.append((size, name, ratio))
+            print(f"  {name:22s} {before[name] * 1000:10.1f} -> {seconds * 1000:10.1f} ms"
+                  f"  x{ratio:.2f}{flag}")
+    return slower
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Earthquake pipeline benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help="catalog sizes to run, e.g. 10000 10000000")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs of each stage; the best time is kept")
+    parser.add_argument('--seed', type=int, default=0, help="synthetic catalog seed")
+    parser.add_argument('--save', metavar='JSON', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='JSON', help="baseline to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="allowed slowdown before a stage is reported, 0.25 for 25%%")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args.sizes, args.repeat, args.seed)
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(report, out, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as b:
+            slower = compare(report, json.load(b), args.tolerance)
+        if slower:
+            print(f"{len(slower)} stages slower than the baseline")
+            sys.exit(1)
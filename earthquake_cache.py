@@ -0,0 +1,312 @@
+'''
+Program: Earthquake catalog cache
+Author: Prashanth Reddy Loka
+Description: Keeps the parsed earthquake catalog and world cities table in a
+        compact binary cache next to the CSV files. Each column is a raw
+        binary file that later runs memory-map instead of parsing the CSV
+        again, so startup takes milliseconds and several processes share the
+        same pages. A cache is rebuilt when the size or modification time of
+        its CSV file changes, except that rows appended to the catalog are
+        parsed on their own and added to the end of the cached columns and
+        the stored per-year and longitude aggregates. A file only counts as
+        appended to when every byte parsed before still hashes the same, so
+        revised older rows always force a rebuild.
+Revisions: 00 - Memory-mapped column cache for the catalog and cities table
+           01 - Loads report earthquake_metrics stages
+           02 - Appended catalog rows update the cache in O(new rows); stored aggregates
+           03 - Appends are recognised by a hash of the whole parsed prefix
+           04 - The file status is taken before parsing and only those bytes are parsed
+'''
+# Import necessary libraries
+import hashlib  # For recognising a CSV file that was only appended to
+import json  # For the cache description file
+import os  # For file paths and the source file status
+import numpy as np  # For the memory-mapped columns
+import earthquake_metrics as metrics  # Optional per-stage timings
+from earthquake_catalog import (CITIES_FILE, EARTHQUAKE_FILE, Catalog, CityTable,
+                                RunningAggregates, load_catalog, load_cities)
+
+CACHE_DIR = ".earthquake_cache"  # Cache folder, created next to the CSV file
+CACHE_VERSION = 3  # Bumped whenever the cache layout changes
+META_FILE = "meta.json"  # Describes the columns of one cached file
+AGGREGATES_FILE = "aggregates.npz"  # Stored per-year and longitude aggregates
+HASH_BLOCK = 1 << 20  # Bytes read at a time when hashing a CSV file
+
+
+def cache_path(path):
+    """
+    Parameters:
+        path (str): Path of a CSV file.
+    Returns:
+        str: Folder holding the cache of that file.
+    """
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, CACHE_DIR, name)
+
+
+def _source_status(path):
+    """
+    Returns:
+        dict: Size and modification time identifying the current CSV file.
+    """
+    status = os.stat(path)
+    return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+
+def _prefix_digests(path, *offsets):
+    """
+    Hashes a file from its start in one pass. Hashing is far cheaper than
+    parsing, so checking the whole parsed prefix keeps an append cheap.
+    Parameters:
+        path (str): Path of the file.
+        *offsets (int): Increasing byte offsets.
+    Returns:
+        list: Hash of the bytes before each offset.
+    """
+    digest = hashlib.sha1()
+    digests = []
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            while f.tell() < offset:
+                block = f.read(min(HASH_BLOCK, offset - f.tell()))
+                if not block:
+                    break
+                digest.update(block)
+            digests.append(digest.hexdigest())
+    return digests
+
+
+def _read_meta(folder):
+    """
+    Returns:
+        dict: Cache description, or None if the cache is missing or unreadable.
+    """
+    try:
+        with open(os.path.join(folder, META_FILE), 'r') as m:
+            meta = json.load(m)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == CACHE_VERSION else None
+
+
+def _write_meta(folder, meta):
+    """
+    Writes the cache description last and atomically, so a cache is only
+    ever seen once all of its columns are complete.
+    """
+    temp = os.path.join(folder, META_FILE + '.tmp')
+    with open(temp, 'w') as m:
+        json.dump(dict(meta, version=CACHE_VERSION), m)
+    os.replace(temp, os.path.join(folder, META_FILE))
+
+
+def _map_column(folder, name, dtype, rows):
+    """
+    Returns:
+        numpy.ndarray: Read-only memory map of one cached column.
+    """
+    if rows == 0:
+        return np.empty(0, dtype=dtype)  # Empty files cannot be mapped
+    return np.memmap(os.path.join(folder, name + '.bin'), dtype=dtype, mode='r', shape=(rows,))
+
+
+def read_cache(path):
+    """
+    Maps the cached columns of a CSV file if the cache is still current.
+    Parameters:
+        path (str): Path of the CSV file.
+    Returns:
+        tuple: (columns, meta) where columns maps names to memory-mapped
+            arrays, or None when there is no current cache.
+    """
+    folder = cache_path(path)
+    meta = _read_meta(folder)
+    if meta is None or meta['source'] != _source_status(path):
+        return None
+    try:
+        columns = {name: _map_column(folder, name, np.dtype(dtype), meta['rows'])
+                   for name, dtype in meta['dtypes'].items()}
+    except (OSError, ValueError):  # Column files missing or truncated
+        return None
+    return columns, meta
+
+
+def write_cache(path, columns, source=None, **extra):
+    """
+    Writes columns parsed from a CSV file to its cache.
+    Parameters:
+        path (str): Path of the CSV file the columns were parsed from.
+        columns (dict): Column name to numpy.ndarray, all the same length.
+        source (dict): _source_status of the file taken before it was
+            parsed, so rows written during parsing are not marked as cached;
+            None to take it now.
+        **extra: Further JSON values stored in the cache description.
+    Returns:
+        dict: The cache description written.
+    """
+    folder = cache_path(path)
+    os.makedirs(folder, exist_ok=True)
+    for stale in (META_FILE, AGGREGATES_FILE):  # Invalidate before rewriting columns
+        try:
+            os.remove(os.path.join(folder, stale))
+        except FileNotFoundError:
+            pass
+    for name, values in columns.items():
+        # A new file renamed over the old one: processes that still map the
+        # old column keep reading it instead of a truncated or changed file
+        column = os.path.join(folder, name + '.bin')
+        np.ascontiguousarray(values).tofile(column + '.tmp')
+        os.replace(column + '.tmp', column)
+    source = _source_status(path) if source is None else source
+    meta = dict(extra, source=source, prefix=_prefix_digests(path, source['size'])[0],
+                rows=len(next(iter(columns.values()))) if columns else 0,
+                dtypes={name: values.dtype.str for name, values in columns.items()})
+    _write_meta(folder, meta)
+    return meta
+
+
+def append_cache(path):
+    """
+    Adds the rows appended to a catalog CSV file since its cache was written.
+    Only the new bytes are parsed; the cached columns are extended in place
+    and the stored aggregates updated, so the cost follows the new rows.
+    Parameters:
+        path (str): Path of the earthquake CSV file.
+    Returns:
+        int: Number of rows added, or None when the file was not simply
+            appended to and the cache has to be rebuilt.
+    """
+    folder = cache_path(path)
+    meta = _read_meta(folder)
+    source = _source_status(path)
+    if meta is None or 'type_names' not in meta:  # No catalog cache to extend
+        return None
+    offset = meta['source']['size']  # Bytes parsed into the cache
+    if source['size'] <= offset:
+        return None
+    parsed, whole = _prefix_digests(path, offset, source['size'])
+    if parsed != meta['prefix']:  # Rows already cached were changed
+        return None
+    added = load_catalog(path, start=offset, type_names=meta['type_names'],
+                         mag_type_names=meta['mag_type_names'],
+                         end=source['size'])  # Exactly the bytes the new status describes
+    totals = read_aggregates(folder)
+    try:
+        os.remove(os.path.join(folder, META_FILE))  # Invalidate while the columns change
+    except FileNotFoundError:
+        pass
+    for name, dtype in meta['dtypes'].items():
+        column = os.path.join(folder, name + '.bin')
+        with open(column, 'r+b') as out:
+            # Drop anything a broken earlier append left past the cached rows
+            out.truncate(meta['rows'] * np.dtype(dtype).itemsize)
+            out.seek(0, os.SEEK_END)
+            np.ascontiguousarray(getattr(added, name), dtype=dtype).tofile(out)
+    if totals is not None:
+        _write_aggregates(folder, totals.add(added.all()))
+    meta.update(source=source, prefix=whole,
+                rows=meta['rows'] + len(added), type_names=added.type_names,
+                mag_type_names=added.mag_type_names)
+    _write_meta(folder, meta)
+    return len(added)
+
+
+def _write_aggregates(folder, totals):
+    """
+    Saves RunningAggregates next to the cached columns.
+    """
+    temp = os.path.join(folder, 'aggregates.tmp.npz')
+    np.savez(temp, **totals.arrays())
+    os.replace(temp, os.path.join(folder, AGGREGATES_FILE))
+
+
+def read_aggregates(folder):
+    """
+    Returns:
+        RunningAggregates: Stored aggregates of a cache folder, or None.
+    """
+    try:
+        with np.load(os.path.join(folder, AGGREGATES_FILE)) as arrays:
+            return RunningAggregates.from_arrays(arrays)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def cached_catalog(path=EARTHQUAKE_FILE):
+    """
+    Loads the earthquake catalog from its cache, parsing the CSV file and
+    writing the cache only when it is missing or out of date.
+    Parameters:
+        path (str): Path of the earthquake CSV file.
+    Returns:
+        Catalog: Typed columns of every record in the file.
+    """
+    with metrics.stage('load catalog') as timed:
+        cached = read_cache(path)
+        if cached is None:
+            try:
+                if append_cache(path) is not None:  # Only new rows were parsed
+                    cached = read_cache(path)
+            except OSError:  # Read-only folder: rebuild in memory
+                pass
+        if cached is not None:
+            columns, meta = cached
+            catalog = Catalog(columns, meta['type_names'], meta['mag_type_names'])
+        else:
+            source = _source_status(path)  # Before parsing: later rows are appended next time
+            catalog = load_catalog(path, end=source['size'])
+            try:
+                write_cache(path, catalog.columns(), source, type_names=catalog.type_names,
+                            mag_type_names=catalog.mag_type_names)
+                _write_aggregates(cache_path(path), RunningAggregates().add(catalog.all()))
+            except OSError:  # Read-only folder: run without a cache
+                pass
+        timed.rows_out = len(catalog)
+    return catalog
+
+
+def cached_aggregates(path=EARTHQUAKE_FILE):
+    """
+    Per-year and longitude aggregates of the whole catalog, read from the
+    cache without loading any column.
+    Parameters:
+        path (str): Path of the earthquake CSV file.
+    Returns:
+        RunningAggregates: Aggregates of every record, or None when the file
+            has no cache yet or was rewritten rather than appended to.
+    """
+    folder = cache_path(path)
+    meta = _read_meta(folder)
+    if meta is None:
+        return None
+    if meta['source'] != _source_status(path):
+        try:
+            if append_cache(path) is None:
+                return None
+        except OSError:
+            return None
+    return read_aggregates(folder)
+
+
+def cached_cities(path=CITIES_FILE):
+    """
+    Loads the world cities table from its cache, parsing the CSV file and
+    writing the cache only when it is missing or out of date.
+    Parameters:
+        path (str): Path of the world cities CSV file.
+    Returns:
+        CityTable: Typed columns of every city in the file.
+    """
+    with metrics.stage('load cities') as timed:
+        cached = read_cache(path)
+        if cached is not None:
+            cities = CityTable(cached[0])
+        else:
+            source = _source_status(path)  # Before parsing, so a rewrite meanwhile is noticed
+            cities = load_cities(path)
+            try:
+                write_cache(path, cities.columns(), source)
+            except OSError:  # Read-only folder: run without a cache
+                pass
+        timed.rows_out = len(cities)
+    return cities
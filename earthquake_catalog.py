@@ -0,0 +1,1369 @@
+'''
+Program: Earthquake catalog
+Author: Prashanth Reddy Loka
+Description: Typed, column oriented storage for the earthquake records used by
+        EarthquakeDatavisualization.py. The CSV file is parsed once into NumPy
+        columns (latitude, longitude, depth, magnitude, date, type codes) and
+        every filter and plot reads from those columns through a Selection of
+        row ids instead of converting strings on every pass.
+Revisions: 00 - Columnar catalog loader and row selections
+           01 - Dates parsed once per distinct string, with year/month columns
+           02 - Sorted column and lat/lng grid indexes for range queries
+           03 - World cities table with a nearest-city spatial join
+           04 - Single pass binning engine (count/sum/mean/min/max per bin)
+           05 - Group-by aggregates by year, month, type, magnitude type or depth band
+           06 - Streaming, chunked ingest with running aggregates
+           07 - Latitude/longitude density grids for large selections
+           08 - Filter chain memoizing the result of each stage
+           09 - Aftershock sequences: events attached to a larger nearby mainshock
+           10 - Loading, filters, aggregations and joins report earthquake_metrics stages
+           11 - Reading from a byte offset, for rows appended since the last load
+           12 - Shared plain settings come from earthquake_constants
+           13 - Group percentiles reject q outside 0 to 100
+           14 - Reading can stop at a byte offset, the file size a cache records
+'''
+# Import necessary libraries
+import csv  # For reading the CSV files
+import io  # For reading the CSV file from a byte offset
+from datetime import datetime as dt  # For parsing the event dates
+from itertools import islice, product  # For reading the CSV file in chunks, neighbour cubes
+import numpy as np  # For the typed columns
+import earthquake_metrics as metrics  # Optional per-stage timings
+from earthquake_constants import (CHUNK_ROWS, CITIES_FILE, EARTHQUAKE_FILE, EPOCH,
+                                  SEQUENCE_DAYS, SEQUENCE_KM)  # Shared plain settings
+
+NO_DATE = np.iinfo(np.int32).min  # Marker stored in the day column for invalid dates
+
+# CSV header names for each typed column
+FLOAT_FIELDS = {'lat': 'Latitude', 'lng': 'Longitude', 'depth': 'Depth', 'mag': 'Magnitude'}
+CODE_FIELDS = {'type_code': 'Type', 'mag_type_code': 'Magnitude Type'}
+DATE_FIELD = 'Date'
+GRID_DEGREES = 1.0  # Cell size of the latitude/longitude grid index
+EARTH_RADIUS_KM = 6371.0  # Mean earth radius used for distances
+SPHERE_CELL = 0.025  # Cell size of the city hash, as a chord of the unit sphere (~160 km)
+JOIN_BLOCK = 4096  # Events compared against the candidate cities at a time
+JOIN_CUBES = 4  # Events are grouped into blocks of this many city cubes per side
+# Depth bands used by group_by('depth_band'), in km
+DEPTH_BANDS = {'shallow (<70 km)': 70, 'intermediate (70-300 km)': 300, 'deep (>300 km)': np.inf}
+STREAM_YEARS = (1900, 2100)  # Years covered by the running per-year aggregates
+DENSITY_SHAPE = (180, 360)  # Latitude x longitude cells of a density grid
+CHAIN_STAGES = ('lat', 'lng', 'day', 'mag')  # Filter stage columns, in order
+CHAIN_CACHE = 64  # Stage results kept by a FilterChain
+
+
+def _floats(values):
+    """
+    Converts a sequence of numeric strings to a float64 array.
+    Parameters:
+        values (sequence): Strings read from one CSV column.
+    Returns:
+        numpy.ndarray: Parsed values, NaN where a value is missing or invalid.
+    """
+    try:
+        return np.array(values, dtype=np.float64)  # Fast path: numpy parses the strings
+    except ValueError:
+        parsed = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):  # Slow path only for chunks with bad values
+            try:
+                parsed[i] = float(value)
+            except ValueError:
+                parsed[i] = np.nan
+        return parsed
+
+
+def _codes(values, names):
+    """
+    Converts a sequence of category strings to small integer codes.
+    Parameters:
+        values (sequence): Strings read from one CSV column.
+        names (dict): Mapping of category name to code, extended in place.
+    Returns:
+        numpy.ndarray: uint8 code for each value.
+    """
+    return np.fromiter((names.setdefault(v, len(names)) for v in values),
+                       dtype=np.uint8, count=len(values))
+
+
+def _epoch_day(date_string):
+    """
+    Converts a 'mm/dd/yyyy' string to a day number.
+    Parameters:
+        date_string (str): Input date string.
+    Returns:
+        int: Days since 01/01/1970, or NO_DATE if the date is not valid.
+    """
+    try:
+        return (dt.strptime(date_string, '%m/%d/%Y') - EPOCH).days
+    except ValueError:
+        return NO_DATE
+
+
+def _days(values, parsed):
+    """
+    Converts a sequence of date strings to day numbers, calling strptime only
+    once for each distinct string.
+    Parameters:
+        values (sequence): Strings read from the Date column.
+        parsed (dict): Date string to day number, extended in place.
+    Returns:
+        numpy.ndarray: int32 day number for each value, NO_DATE when invalid.
+    """
+    def lookup(date_string):
+        day = parsed.get(date_string)
+        if day is None:  # First time this date is seen
+            day = parsed[date_string] = _epoch_day(date_string)
+        return day
+    return np.fromiter((lookup(s) for s in values), dtype=np.int32, count=len(values))
+
+
+def _date_parts(day):
+    """
+    Derives calendar columns from the day column.
+    Parameters:
+        day (numpy.ndarray): int32 days since 01/01/1970, NO_DATE when invalid.
+    Returns:
+        tuple: (valid, year, month) arrays; year and month are 0 for invalid dates.
+    """
+    valid = day != NO_DATE
+    # Months since 01/1970 of each record, from numpy's calendar arithmetic
+    months = np.where(valid, day, 0).astype('datetime64[D]').astype('datetime64[M]')
+    months = months.astype(np.int64)
+    year = np.where(valid, months // 12 + 1970, 0).astype(np.int16)
+    month = np.where(valid, months % 12 + 1, 0).astype(np.int8)
+    return valid, year, month
+
+
+def _parse_chunk(rows, fields, type_names, mag_type_names, parsed_dates):
+    """
+    Converts a block of CSV rows into typed columns.
+    Parameters:
+        rows (list): Rows returned by csv.reader.
+        fields (dict): Mapping of CSV header name to column position.
+        type_names, mag_type_names (dict): Category code tables, extended in place.
+        parsed_dates (dict): Date string to day number cache, extended in place.
+    Returns:
+        dict: Column name to numpy.ndarray.
+    """
+    raw = list(zip(*rows))  # Transpose the rows into per-field tuples
+    columns = {name: _floats(raw[fields[header]]) for name, header in FLOAT_FIELDS.items()}
+    columns['day'] = _days(raw[fields[DATE_FIELD]], parsed_dates)
+    columns['type_code'] = _codes(raw[fields[CODE_FIELDS['type_code']]], type_names)
+    columns['mag_type_code'] = _codes(raw[fields[CODE_FIELDS['mag_type_code']]],
+                                      mag_type_names)
+    return columns
+
+
+class Catalog:
+    """
+    Typed earthquake columns parsed once from the CSV file.
+    Attributes:
+        lat, lng, depth, mag (numpy.ndarray): float64 columns.
+        day (numpy.ndarray): int32 days since 01/01/1970, NO_DATE when invalid.
+        valid_date (numpy.ndarray): True where the record has a valid date.
+        year, month (numpy.ndarray): Calendar year and month, 0 when invalid.
+        type_code, mag_type_code (numpy.ndarray): uint8 category codes.
+        type_names, mag_type_names (list): Category name for each code.
+    """
+    COLUMNS = ('lat', 'lng', 'depth', 'mag', 'day', 'type_code', 'mag_type_code')
+    DERIVED = ('valid_date', 'year', 'month')  # Worked out from day when not given
+
+    def __init__(self, columns, type_names, mag_type_names):
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        if all(name in columns for name in self.DERIVED):
+            self.valid_date, self.year, self.month = (columns[name] for name in self.DERIVED)
+        else:
+            self.valid_date, self.year, self.month = _date_parts(self.day)
+        self.type_names = list(type_names)
+        self.mag_type_names = list(mag_type_names)
+        self._index = None  # CatalogIndex, built on first query
+        self._sequences = {}  # (km, days) to the mainshock column
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def index(self):
+        """
+        Returns:
+            CatalogIndex: Range indexes over the catalog columns.
+        """
+        if self._index is None:
+            self._index = CatalogIndex(self)
+        return self._index
+
+    def all(self):
+        """
+        Returns:
+            Selection: Every row of the catalog.
+        """
+        return Selection(self)
+
+    def sequences(self, km=SEQUENCE_KM, days=SEQUENCE_DAYS):
+        """
+        Attaches aftershocks to their mainshock over the whole catalog, and
+        keeps the result as the mainshock column.
+        Parameters:
+            km (float): Largest distance from a larger event.
+            days (int): Largest number of days from a larger event.
+        Returns:
+            numpy.ndarray: Row of the mainshock of each record; a mainshock
+                or an independent event is its own mainshock.
+        """
+        if (km, days) not in self._sequences:
+            with metrics.stage('sequences', len(self)) as timed:
+                mainshock = find_mainshocks(self.lat, self.lng, self.day, self.mag, km, days)
+                timed.rows_out = int(np.count_nonzero(mainshock == np.arange(len(self))))
+            self._sequences[(km, days)] = mainshock
+        self.mainshock = self._sequences[(km, days)]
+        return self.mainshock
+
+    def columns(self):
+        """
+        Returns:
+            dict: Column name to array, stored and derived columns.
+        """
+        return {name: getattr(self, name) for name in self.COLUMNS + self.DERIVED}
+
+
+class _Prefix(io.RawIOBase):
+    """
+    Reads a binary file only up to a byte offset, so rows written to it after
+    its size was taken are left for the next load.
+    """
+
+    def __init__(self, raw, end):
+        self.raw = raw
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def readinto(self, buffer):
+        left = self.end - self.raw.tell()
+        if left <= 0:
+            return 0
+        return self.raw.readinto(memoryview(buffer)[:left])
+
+
+def iter_chunks(path=EARTHQUAKE_FILE, chunk_rows=CHUNK_ROWS, start=0,
+                type_names=(), mag_type_names=(), end=None):
+    """
+    Reads the earthquake CSV file a block of rows at a time.
+    Parameters:
+        path (str): Path of the earthquake CSV file.
+        chunk_rows (int): Number of rows in each block.
+        start (int): Byte offset of the first row to read, after the header
+            when 0; rows appended since an earlier load start at its end.
+        type_names, mag_type_names (list): Category names already given a
+            code, so appended rows keep the codes of the earlier load.
+        end (int): Byte offset to stop reading at, None for the end of file.
+    Yields:
+        Catalog: Typed columns of the next block of rows. All blocks share
+            the same type and magnitude type codes.
+    """
+    # Category code tables
+    type_names = {name: code for code, name in enumerate(type_names)}
+    mag_type_names = {name: code for code, name in enumerate(mag_type_names)}
+    parsed_dates = {}  # Each distinct date string is parsed once
+    with open(path, 'rb', buffering=0) as f:
+        raw = io.BufferedReader(f if end is None else _Prefix(f, end))
+        e = io.TextIOWrapper(raw, newline='')
+        reader = csv.reader(e)
+        fields = {name: i for i, name in enumerate(next(reader))}  # Header positions
+        if start:  # Continue from the offset instead of after the header
+            raw = e.detach()
+            raw.seek(start)
+            reader = csv.reader(io.TextIOWrapper(raw, newline=''))
+        while True:
+            rows = list(islice(reader, chunk_rows))  # Next block of rows
+            if not rows:
+                break
+            rows = [row for row in rows if row]  # Blank lines, such as a newline before appended rows
+            if not rows:
+                continue
+            columns = _parse_chunk(rows, fields, type_names, mag_type_names, parsed_dates)
+            yield Catalog(columns, type_names, mag_type_names)
+
+
+def load_catalog(path=EARTHQUAKE_FILE, start=0, type_names=(), mag_type_names=(), end=None):
+    """
+    Reads the earthquake CSV file into a Catalog.
+    Parameters:
+        path (str): Path of the earthquake CSV file.
+        start, type_names, mag_type_names: Offset and code tables for
+            reading only appended rows, see iter_chunks.
+        end (int): Byte offset to stop reading at, None for the end of file.
+    Returns:
+        Catalog: Typed columns of every record in the file, or from start.
+    """
+    with metrics.stage('parse catalog') as timed:
+        chunks = list(iter_chunks(path, start=start, type_names=type_names,
+                                  mag_type_names=mag_type_names, end=end))
+        if chunks:
+            columns = {name: np.concatenate([getattr(c, name) for c in chunks])
+                       for name in Catalog.COLUMNS + Catalog.DERIVED}
+            catalog = Catalog(columns, chunks[-1].type_names, chunks[-1].mag_type_names)
+        else:
+            columns = {name: np.empty(0, dtype=np.int32 if name == 'day' else
+                                      np.uint8 if name in CODE_FIELDS else np.float64)
+                       for name in Catalog.COLUMNS}
+            catalog = Catalog(columns, type_names, mag_type_names)
+        timed.rows_out = len(catalog)
+    return catalog
+
+
+class Selection:
+    """
+    A set of catalog rows chosen by the filters.
+    Attributes:
+        catalog (Catalog): Catalog the rows belong to.
+        rows (numpy.ndarray or None): Sorted row ids, None for every row.
+    """
+
+    def __init__(self, catalog, rows=None):
+        self.catalog = catalog
+        self.rows = rows
+        self._columns = {}  # Gathered columns, filled on first use
+
+    def __len__(self):
+        return len(self.catalog) if self.rows is None else len(self.rows)
+
+    def column(self, name):
+        """
+        Gathers one catalog column for the selected rows.
+        Parameters:
+            name (str): Column name, one of Catalog.COLUMNS or a derived
+                date column (valid_date, year, month).
+        Returns:
+            numpy.ndarray: Column values of the selected rows.
+        """
+        if name not in self._columns:
+            values = getattr(self.catalog, name)
+            self._columns[name] = values if self.rows is None else values[self.rows]
+        return self._columns[name]
+
+    @property
+    def lat(self):
+        return self.column('lat')
+
+    @property
+    def lng(self):
+        return self.column('lng')
+
+    @property
+    def depth(self):
+        return self.column('depth')
+
+    @property
+    def mag(self):
+        return self.column('mag')
+
+    @property
+    def day(self):
+        return self.column('day')
+
+    @property
+    def valid_date(self):
+        return self.column('valid_date')
+
+    @property
+    def year(self):
+        return self.column('year')
+
+    @property
+    def month(self):
+        return self.column('month')
+
+    def date_range(self):
+        """
+        Returns:
+            tuple: (first, last) valid day numbers of the selection,
+                or None when no record has a valid date.
+        """
+        days = self.day[self.valid_date]
+        if not len(days):
+            return None
+        return int(days.min()), int(days.max())
+
+    def where(self, **bounds):
+        """
+        Narrows the selection to rows inside inclusive column ranges.
+        Parameters:
+            **bounds: Column name mapped to a (minimum, maximum) tuple,
+                for example where(lat=(-10, 10), mag=(6, 9.1)).
+        Returns:
+            Selection: Rows of this selection satisfying every range.
+        """
+        return Selection(self.catalog, self.catalog.index.query(self.rows, bounds))
+
+    def bins(self, axes, values='mag'):
+        """
+        Aggregates a column over bins of one or more other columns.
+        Parameters:
+            axes (dict): Column name mapped to its Axis, for example
+                {'lat': Axis(-90, 90, 18), 'lng': Axis(-180, 180, 36)}.
+            values (str): Column aggregated in each bin.
+        Returns:
+            BinStats: Per-bin statistics, shaped like the axes.
+        """
+        return bin_stats([self.column(name) for name in axes], list(axes.values()),
+                         self.column(values))
+
+    def density(self, lat=(-90, 90), lng=(-180, 180), shape=DENSITY_SHAPE):
+        """
+        Rasterizes the selected records inside a box into a fixed size grid.
+        Only the rows inside the box are fetched, through the catalog index,
+        so zooming into a region costs the rows of that region.
+        Parameters:
+            lat, lng (tuple): (minimum, maximum) bounds of the box in degrees.
+            shape (tuple): Number of latitude and longitude cells.
+        Returns:
+            BinStats: Count and magnitude statistics of each cell, shaped
+                (latitude cells, longitude cells).
+        """
+        region = self.where(lat=lat, lng=lng)
+        return region.bins({'lat': Axis(lat[0], lat[1], shape[0]),
+                            'lng': Axis(lng[0], lng[1], shape[1])})
+
+    def sequences(self, km=SEQUENCE_KM, days=SEQUENCE_DAYS):
+        """
+        Parameters:
+            km, days: Sequence window, see Catalog.sequences.
+        Returns:
+            numpy.ndarray: Catalog row of the mainshock of each selected record.
+        """
+        mainshock = self.catalog.sequences(km, days)
+        return mainshock if self.rows is None else mainshock[self.rows]
+
+    def mainshocks(self, km=SEQUENCE_KM, days=SEQUENCE_DAYS):
+        """
+        Returns:
+            Selection: Selected records that are their own mainshock, that is
+                the catalog with the aftershocks taken out.
+        """
+        rows = np.arange(len(self.catalog)) if self.rows is None else self.rows
+        return Selection(self.catalog, rows[self.sequences(km, days) == rows])
+
+    def group_by(self, key):
+        """
+        Groups the selected records for aggregation.
+        Parameters:
+            key (str): 'year', 'month', 'type', 'mag_type' or 'depth_band'.
+        Returns:
+            GroupBy: Groups of the selection; records with an invalid date
+                are left out of the year and month groups.
+        """
+        with metrics.stage('group_by ' + key, len(self)) as timed:
+            grouped = GroupBy(self, key)
+            timed.rows_out = len(grouped)
+        return grouped
+
+
+class SortedIndex:
+    """
+    Row ids of one column ordered by value, so a range query is two binary
+    searches plus the matching rows.
+    Attributes:
+        order (numpy.ndarray): Row ids sorted by column value.
+        values (numpy.ndarray): Column values in sorted order.
+    """
+
+    def __init__(self, values):
+        self.order = np.argsort(values, kind='stable')
+        self.values = values[self.order]
+
+    def _bounds(self, low, high):
+        return (np.searchsorted(self.values, low, side='left'),
+                np.searchsorted(self.values, high, side='right'))
+
+    def count(self, low, high):
+        """
+        Returns:
+            int: Number of rows with low <= value <= high, in O(log n).
+        """
+        start, stop = self._bounds(low, high)
+        return max(int(stop - start), 0)
+
+    def range(self, low, high):
+        """
+        Returns:
+            numpy.ndarray: Sorted row ids with low <= value <= high.
+        """
+        start, stop = self._bounds(low, high)
+        return np.sort(self.order[start:stop])
+
+
+class GridIndex:
+    """
+    Row ids bucketed into GRID_DEGREES latitude/longitude cells, so a box
+    query only visits the cells it overlaps.
+    Attributes:
+        order (numpy.ndarray): Row ids sorted by cell number.
+        starts (numpy.ndarray): Position in order where each cell begins.
+    """
+
+    def __init__(self, lat, lng, degrees=GRID_DEGREES):
+        self.degrees = degrees
+        self.rows = int(np.ceil(180 / degrees)) + 1  # Grid rows, latitude
+        self.cols = int(np.ceil(360 / degrees)) + 1  # Grid columns, longitude
+        cells = self._cells(lat, lng)
+        self.order = np.argsort(cells, kind='stable')
+        # Rows with a missing coordinate fall in the extra cell past the grid
+        self.starts = np.searchsorted(cells[self.order], np.arange(self.rows * self.cols + 1))
+
+    def _row(self, lat):
+        return np.clip(((lat + 90) // self.degrees).astype(np.int64), 0, self.rows - 1)
+
+    def _col(self, lng):
+        return np.clip(((lng + 180) // self.degrees).astype(np.int64), 0, self.cols - 1)
+
+    def _cells(self, lat, lng):
+        missing = np.isnan(lat) | np.isnan(lng)
+        lat, lng = np.where(missing, 0, lat), np.where(missing, 0, lng)
+        cells = self._row(lat) * self.cols + self._col(lng)
+        cells[missing] = self.rows * self.cols
+        return cells
+
+    def _spans(self, lat_range, lng_range):
+        """
+        Returns:
+            tuple: (starts, stops) positions in order of the cells overlapping the box,
+                one contiguous span per grid row.
+        """
+        first, last = self._row(np.array(lat_range, dtype=np.float64))
+        west, east = self._col(np.array(lng_range, dtype=np.float64))
+        row_cells = np.arange(first, last + 1) * self.cols
+        return self.starts[row_cells + west], self.starts[row_cells + east + 1]
+
+    def count(self, lat_range, lng_range):
+        """
+        Returns:
+            int: Number of rows in the cells overlapping the box, in O(grid rows).
+        """
+        starts, stops = self._spans(lat_range, lng_range)
+        return int((stops - starts).sum())
+
+    def box(self, lat_range, lng_range):
+        """
+        Returns:
+            numpy.ndarray: Sorted row ids of the cells overlapping the box; rows in
+                the border cells still have to be checked against the exact bounds.
+        """
+        starts, stops = self._spans(lat_range, lng_range)
+        spans = [self.order[start:stop] for start, stop in zip(starts, stops)]
+        return np.sort(np.concatenate(spans)) if spans else np.empty(0, dtype=np.intp)
+
+
+class CatalogIndex:
+    """
+    Range indexes over the catalog columns, built lazily per column.
+    A query is answered from the most selective index: its candidate rows are
+    fetched in O(log n + k) and checked against the remaining ranges and the
+    current selection, so the rest of the catalog is never scanned.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._sorted = {}  # Column name to SortedIndex
+        self._grid = None  # GridIndex over lat/lng
+
+    def sorted(self, name):
+        """
+        Returns:
+            SortedIndex: Index of the named column.
+        """
+        if name not in self._sorted:
+            self._sorted[name] = SortedIndex(getattr(self.catalog, name))
+        return self._sorted[name]
+
+    @property
+    def grid(self):
+        """
+        Returns:
+            GridIndex: Latitude/longitude grid of the catalog.
+        """
+        if self._grid is None:
+            self._grid = GridIndex(self.catalog.lat, self.catalog.lng)
+        return self._grid
+
+    def query(self, rows, bounds):
+        """
+        Finds the rows satisfying every inclusive range.
+        Parameters:
+            rows (numpy.ndarray or None): Sorted row ids to search within, None for all.
+            bounds (dict): Column name mapped to a (minimum, maximum) tuple.
+        Returns:
+            numpy.ndarray: Sorted row ids.
+        """
+        if not bounds:
+            return np.arange(len(self.catalog)) if rows is None else rows
+        # Candidate plans: (estimated rows, fetch function)
+        plans = [(self.sorted(name).count(low, high),
+                  lambda name=name, low=low, high=high: self.sorted(name).range(low, high))
+                 for name, (low, high) in bounds.items()]
+        if 'lat' in bounds and 'lng' in bounds:
+            plans.append((self.grid.count(bounds['lat'], bounds['lng']),
+                          lambda: self.grid.box(bounds['lat'], bounds['lng'])))
+        estimate, fetch = min(plans, key=lambda plan: plan[0])
+        if rows is not None and len(rows) <= estimate:
+            candidates = rows  # The current selection is already the smaller set
+        else:
+            candidates = fetch()
+            if rows is not None:  # Keep only candidates inside the current selection
+                at = np.searchsorted(rows, candidates)
+                at[at == len(rows)] = 0
+                candidates = candidates[rows[at] == candidates] if len(rows) else rows
+        return candidates[_in_bounds(self.catalog, candidates, bounds)]
+
+
+def _in_bounds(catalog, rows, bounds):
+    """
+    Checks rows against inclusive column ranges without an index.
+    Parameters:
+        catalog (Catalog): Catalog holding the columns.
+        rows (numpy.ndarray or None): Row ids to check, None for every row.
+        bounds (dict): Column name mapped to a (minimum, maximum) tuple.
+    Returns:
+        numpy.ndarray: True for each row inside every range.
+    """
+    keep = np.ones(len(catalog) if rows is None else len(rows), dtype=bool)
+    for name, (low, high) in bounds.items():
+        values = getattr(catalog, name)
+        values = values if rows is None else values[rows]
+        keep &= (values >= low) & (values <= high)
+    return keep
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance between points, with numpy broadcasting.
+    Parameters:
+        lat1, lng1, lat2, lng2 (numpy.ndarray or float): Coordinates in degrees.
+    Returns:
+        numpy.ndarray: Distances in kilometres.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _unit_vectors(lat, lng):
+    """
+    Returns:
+        numpy.ndarray: (n, 3) points on the unit sphere for the coordinates.
+    """
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+class SphereGrid:
+    """
+    Spatial hash of points on the unit sphere, bucketed into cubes of
+    SPHERE_CELL. Straight-line (chord) distance grows with great circle
+    distance, so every point more than r cubes away from a query box is at
+    least r * SPHERE_CELL away, which bounds the nearest neighbour search.
+    Attributes:
+        corners (numpy.ndarray): (x, y, z) coordinates of each cube holding points.
+        starts (numpy.ndarray): Position in order where each of those cubes begins.
+        order (numpy.ndarray): Point ids sorted by cube.
+        points (numpy.ndarray): (n, 3) unit vectors of the points.
+    """
+
+    def __init__(self, lat, lng, cell=SPHERE_CELL):
+        self.cell = cell
+        self.points = _unit_vectors(lat, lng)
+        cubes = self.cube_coords(self.points)
+        keys = np.ravel_multi_index(cubes.T, self._shape())  # One number per cube
+        self.order = np.argsort(keys, kind='stable')
+        keys, self.starts = np.unique(keys[self.order], return_index=True)
+        self.starts = np.append(self.starts, len(self.order))
+        self.corners = np.column_stack(np.unravel_index(keys, self._shape()))
+
+    def _shape(self):
+        side = int(np.ceil(2 / self.cell)) + 1  # Cubes along each axis
+        return side, side, side
+
+    def cube_coords(self, points):
+        """
+        Returns:
+            numpy.ndarray: (n, 3) integer cube coordinates of unit vectors.
+        """
+        return np.floor((points + 1) / self.cell).astype(np.int64)
+
+    def within(self, low, high):
+        """
+        Finds the points whose cube lies inside a box of cubes.
+        Parameters:
+            low, high (numpy.ndarray): Inclusive (x, y, z) cube coordinate bounds.
+        Returns:
+            numpy.ndarray: Point ids.
+        """
+        # Only cubes holding points are tested, however wide the box
+        at = np.flatnonzero(((self.corners >= low) & (self.corners <= high)).all(axis=1))
+        starts, lengths = self.starts[at], self.starts[at + 1] - self.starts[at]
+        # Positions of every point in those cubes, without a Python loop
+        ends = np.cumsum(lengths)
+        total = int(ends[-1]) if len(ends) else 0
+        return self.order[np.arange(total) + np.repeat(starts - ends + lengths, lengths)]
+
+    def radius_for(self, km):
+        """
+        Returns:
+            int: Cube radius guaranteed to contain every point within km.
+        """
+        chord = 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+        return int(chord // self.cell) + 1
+
+    def blocks(self, lat, lng):
+        """
+        Groups query coordinates into blocks of JOIN_CUBES cubes per side, so
+        each block is matched against its candidate points in one pass.
+        Parameters:
+            lat, lng (numpy.ndarray): Coordinates in degrees.
+        Returns:
+            list: (low, high, rows) for each occupied block, where low and high
+                are its cube coordinate bounds; rows with a missing coordinate
+                are left out.
+        """
+        rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+        if not len(rows):
+            return []
+        corner = self.cube_coords(_unit_vectors(lat[rows], lng[rows])) // JOIN_CUBES
+        keys = np.ravel_multi_index(corner.T, self._shape())
+        order = np.argsort(keys, kind='stable')
+        keys, starts = np.unique(keys[order], return_index=True)
+        lows = np.column_stack(np.unravel_index(keys, self._shape())) * JOIN_CUBES
+        return [(low, low + JOIN_CUBES - 1, group)
+                for low, group in zip(lows, np.split(rows[order], starts[1:]))]
+
+
+class CityTable:
+    """
+    World cities with a spatial hash for nearest-city queries.
+    Attributes:
+        name, country, iso3 (numpy.ndarray): City, country name and code strings.
+        lat, lng (numpy.ndarray): float64 coordinates.
+        pop (numpy.ndarray): float64 population, NaN when unknown.
+    """
+    COLUMNS = ('name', 'lat', 'lng', 'country', 'iso3', 'pop')
+
+    def __init__(self, columns):
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        self._grid = None  # SphereGrid, built on first query
+
+    def __len__(self):
+        return len(self.lat)
+
+    def columns(self):
+        """
+        Returns:
+            dict: Column name to array.
+        """
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            self._grid = SphereGrid(self.lat, self.lng)
+        return self._grid
+
+    def nearest(self, lat, lng):
+        """
+        Finds the nearest city to each coordinate.
+        Parameters:
+            lat, lng (numpy.ndarray): Coordinates in degrees, e.g. Selection.lat/lng.
+        Returns:
+            tuple: (city, km) arrays; city is the row of the nearest city
+                (-1 for a missing coordinate) and km its distance.
+        """
+        city = np.full(len(lat), -1, dtype=np.intp)
+        km = np.full(len(lat), np.nan)
+        if not len(self):
+            return city, km
+        with metrics.stage('nearest city', len(lat)) as timed:
+            grid = self.grid
+            for low, high, rows in grid.blocks(lat, lng):
+                radius = 1
+                found = grid.within(low - radius, high + radius)
+                while not len(found):  # Widen the search until some city is found
+                    radius *= 2
+                    found = grid.within(low - radius, high + radius)
+                self._closest(rows, found, lat, lng, city, km)
+                # The true nearest city is no farther than the best match so far,
+                # so it lies within the radius covering that distance
+                wider = grid.radius_for(km[rows].max())
+                if wider > radius:
+                    self._closest(rows, grid.within(low - wider, high + wider),
+                                  lat, lng, city, km)
+            timed.rows_out = int(np.count_nonzero(city >= 0))
+        return city, km
+
+    def _closest(self, rows, found, lat, lng, city, km):
+        """
+        Stores the closest of the candidate cities for each of the rows.
+        The largest dot product of unit vectors is the nearest city, so the
+        candidates are ranked with one matrix product and only the winners
+        go through haversine.
+        """
+        candidates = self.grid.points[found].T
+        for block in range(0, len(rows), JOIN_BLOCK):
+            part = rows[block:block + JOIN_BLOCK]
+            best = found[(_unit_vectors(lat[part], lng[part]) @ candidates).argmax(axis=1)]
+            city[part] = best
+            km[part] = haversine(lat[part], lng[part], self.lat[best], self.lng[best])
+
+    def population_within(self, lat, lng, km):
+        """
+        Sums the population of the cities within a distance of each coordinate.
+        Parameters:
+            lat, lng (numpy.ndarray): Coordinates in degrees.
+            km (float): Search distance in kilometres.
+        Returns:
+            numpy.ndarray: Population within km of each coordinate.
+        """
+        total = np.zeros(len(lat))
+        if not len(self):
+            return total
+        with metrics.stage('population within', len(lat)) as timed:
+            grid = self.grid
+            pop = np.nan_to_num(self.pop)
+            radius = grid.radius_for(km)
+            closest = np.cos(min(km / EARTH_RADIUS_KM, np.pi))  # Smallest dot product within km
+            for low, high, rows in grid.blocks(lat, lng):
+                found = grid.within(low - radius, high + radius)
+                if not len(found):
+                    continue
+                candidates = grid.points[found].T
+                for block in range(0, len(rows), JOIN_BLOCK):
+                    part = rows[block:block + JOIN_BLOCK]
+                    near = _unit_vectors(lat[part], lng[part]) @ candidates >= closest
+                    total[part] = near @ pop[found]
+            timed.rows_out = int(np.count_nonzero(total))
+        return total
+
+
+def load_cities(path=CITIES_FILE):
+    """
+    Reads the world cities CSV file into a CityTable.
+    Parameters:
+        path (str): Path of the world cities CSV file.
+    Returns:
+        CityTable: Typed columns of every city in the file.
+    """
+    with metrics.stage('parse cities') as timed:
+        with open(path, 'r', newline='') as w:
+            reader = csv.reader(w)
+            fields = {name: i for i, name in enumerate(next(reader))}  # Header positions
+            raw = list(zip(*reader)) or [()] * len(fields)  # Transpose into per-field tuples
+        cities = CityTable({'name': np.array(raw[fields['city']], dtype=str),
+                            'lat': _floats(raw[fields['lat']]),
+                            'lng': _floats(raw[fields['lng']]),
+                            'country': np.array(raw[fields['country']], dtype=str),
+                            'iso3': np.array(raw[fields['iso3']], dtype=str),
+                            'pop': _floats(raw[fields['pop']])})
+        timed.rows_out = len(cities)
+    return cities
+
+
+def find_mainshocks(lat, lng, day, mag, km=SEQUENCE_KM, days=SEQUENCE_DAYS):
+    """
+    Groups events into sequences. An event within km and days of a larger
+    event is attached to the largest such event, and through it to the
+    mainshock of that event's sequence. Candidate pairs come from a sweep
+    over the events sorted by SphereGrid cube and then by day, so only events
+    in neighbouring cubes and inside the time window are ever compared.
+    Parameters:
+        lat, lng (numpy.ndarray): Coordinates in degrees.
+        day (numpy.ndarray): Day numbers, NO_DATE when invalid.
+        mag (numpy.ndarray): Magnitudes.
+        km (float): Largest distance from a larger event.
+        days (int): Largest number of days from a larger event.
+    Returns:
+        numpy.ndarray: Position of the mainshock of each event; an event with
+            no larger event nearby, or with a missing value, is its own.
+    """
+    mainshock = np.arange(len(mag))
+    usable = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng) | np.isnan(mag)) &
+                            (day != NO_DATE))
+    if len(usable) < 2:
+        return mainshock
+    chord = 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)  # km as a unit sphere distance
+    # Cubes at least twice the window, so only the adjacent cubes can hold a partner
+    grid = SphereGrid(lat[usable], lng[usable], cell=max(SPHERE_CELL, 2 * chord))
+    shape = np.array(grid._shape())
+    cube_keys, cube = np.unique(np.ravel_multi_index(grid.cube_coords(grid.points).T, shape),
+                                return_inverse=True)
+    # Sweep key: cube, then day, shifted so day +/- days stays inside its cube
+    t = day[usable].astype(np.int64) - int(day[usable].min()) + days
+    span = int(t.max()) + days + 1
+    order = np.argsort(cube * span + t, kind='stable')  # Events in sweep order from here on
+    usable, points, t = usable[order], grid.points[order], t[order]
+    sweep = cube[order] * span + t
+    cubes = np.column_stack(np.unravel_index(cube_keys[cube[order]], shape))
+    mag = mag[usable]
+    best, best_mag = np.arange(len(usable)), mag.copy()  # Largest partner so far
+    reach = grid.radius_for(km)
+    for offset in product(range(-reach, reach + 1), repeat=3):
+        other = cubes + offset
+        inside = np.flatnonzero(((other >= 0) & (other < shape)).all(axis=1))
+        keys = np.ravel_multi_index(other[inside].T, shape)
+        at = np.minimum(np.searchsorted(cube_keys, keys), len(cube_keys) - 1)
+        i = inside[cube_keys[at] == keys]  # Events whose neighbour cube holds events
+        at = at[cube_keys[at] == keys]
+        # Queries come in sweep order, so these searches walk the array forwards
+        lo = np.searchsorted(sweep, at * span + t[i] - days, 'left')
+        hi = np.searchsorted(sweep, at * span + t[i] + days, 'right')
+        # Every (event, partner) pair in the window, without a Python loop
+        counts = hi - lo
+        ends = np.cumsum(counts)
+        total = int(ends[-1]) if len(ends) else 0
+        j = np.arange(total) + np.repeat(lo - ends + counts, counts)
+        i = np.repeat(i, counts)
+        near = (mag[j] > mag[i]) & ((points[i] * points[j]).sum(axis=1) >=
+                                    1 - chord * chord / 2)
+        i, j = i[near], j[near]
+        # Keep the largest partner of each event, the first one on a tie
+        last = np.lexsort((-usable[j], mag[j], i))
+        i, j = i[last], j[last]
+        top = np.append(i[1:] != i[:-1], True)[:len(i)]
+        i, j = i[top], j[top]
+        larger = (mag[j] > best_mag[i]) | ((mag[j] == best_mag[i]) &
+                                           (usable[j] < usable[best[i]]))
+        best[i[larger]], best_mag[i[larger]] = j[larger], mag[j[larger]]
+    # Follow each event's chain of larger partners up to its mainshock
+    while True:
+        root = best[best]
+        if np.array_equal(root, best):
+            break
+        best = root
+    mainshock[usable] = usable[best]
+    return mainshock
+
+
+class Axis:
+    """
+    One binning dimension: count equal-width bins over [low, high], or bins
+    between explicit edges. Values outside the edges are dropped, and the
+    last bin includes its upper edge when closed is True (like plt.hist).
+    Attributes:
+        edges (numpy.ndarray): Bin edges, one more than the number of bins.
+    """
+
+    def __init__(self, low=None, high=None, count=None, edges=None, closed=True):
+        if edges is None:
+            edges = np.linspace(low, high, count + 1)
+            self._width = (high - low) / count  # Equal widths: no search needed
+        else:
+            edges = np.asarray(edges, dtype=np.float64)
+            self._width = None
+        self.edges = edges
+        self.closed = closed
+
+    def __len__(self):
+        return len(self.edges) - 1
+
+    def index(self, values):
+        """
+        Finds the bin of each value in O(1) for equal widths, O(log bins) otherwise.
+        Parameters:
+            values (numpy.ndarray): Values to bin.
+        Returns:
+            numpy.ndarray: int64 bin number of each value, -1 outside the edges.
+        """
+        edges, last = self.edges, len(self) - 1
+        if self._width is None:
+            bins = np.searchsorted(edges, values, side='right') - 1
+        else:
+            bins = np.floor((values - edges[0]) / self._width)
+            bins = np.clip(np.nan_to_num(bins, nan=-1), -1, last + 1).astype(np.int64)
+            inside = (bins >= 0) & (bins <= last)
+            # Correct rounding at the edges, as np.histogram does
+            at = np.where(inside, bins, 0)
+            bins -= inside & (values < edges[at])
+            bins += inside & (at < last) & (values >= edges[np.minimum(at + 1, last + 1)])
+        if self.closed:
+            bins[values == edges[-1]] = last
+        bins[(bins > last) | (bins < 0) | ~(values >= edges[0])] = -1
+        return bins
+
+
+class BinStats:
+    """
+    Count, sum, minimum and maximum of a value in every bin.
+    Attributes:
+        axes (list): Axis of each dimension.
+        count (numpy.ndarray): Number of values in each bin.
+        sum, min, max (numpy.ndarray): Aggregates of each bin; min and max
+            are NaN for empty bins.
+    """
+
+    def __init__(self, axes):
+        self.axes = list(axes)
+        shape = tuple(len(axis) for axis in self.axes)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.sum = np.zeros(shape)
+        self._min = np.full(shape, np.inf)
+        self._max = np.full(shape, -np.inf)
+
+    @property
+    def min(self):
+        return np.where(self.count > 0, self._min, np.nan)
+
+    @property
+    def max(self):
+        return np.where(self.count > 0, self._max, np.nan)
+
+    def mean(self, empty=np.nan):
+        """
+        Parameters:
+            empty (float): Value reported for bins without values.
+        Returns:
+            numpy.ndarray: Mean of each bin.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.sum / self.count, empty)
+
+    def add(self, columns, values):
+        """
+        Adds values to the bins in one vectorized pass.
+        Parameters:
+            columns (list): One array of coordinates per axis.
+            values (numpy.ndarray): Value aggregated for each coordinate.
+        Returns:
+            BinStats: self, for chaining.
+        """
+        flat = np.zeros(len(values), dtype=np.int64)
+        keep = np.ones(len(values), dtype=bool)
+        for axis, column, size in zip(self.axes, columns, self.count.shape):
+            bins = axis.index(column)
+            keep &= bins >= 0
+            flat = flat * size + bins  # Row-major bin number
+        flat, values = flat[keep], values[keep]
+        size = self.count.size
+        self.count += np.bincount(flat, minlength=size).reshape(self.count.shape)
+        self.sum += np.bincount(flat, weights=values, minlength=size).reshape(self.count.shape)
+        np.minimum.at(self._min.reshape(-1), flat, values)
+        np.maximum.at(self._max.reshape(-1), flat, values)
+        return self
+
+    def merge(self, other):
+        """
+        Adds the aggregates of another BinStats over the same axes.
+        Returns:
+            BinStats: self, for chaining.
+        """
+        self.count += other.count
+        self.sum += other.sum
+        np.minimum(self._min, other._min, out=self._min)
+        np.maximum(self._max, other._max, out=self._max)
+        return self
+
+
+def bin_stats(columns, axes, values):
+    """
+    Aggregates values over bins of one or more coordinate columns.
+    Parameters:
+        columns (list): One array of coordinates per axis.
+        axes (list): Axis of each dimension.
+        values (numpy.ndarray): Value aggregated for each coordinate.
+    Returns:
+        BinStats: Per-bin statistics.
+    """
+    with metrics.stage('bins ' + 'x'.join(str(len(axis)) for axis in axes),
+                       len(values)) as timed:
+        stats = BinStats(axes).add(columns, values)
+        timed.rows_out = int(stats.count.sum())
+    return stats
+
+
+class GroupBy:
+    """
+    Records of a selection split into groups. The group of every record is
+    worked out once, and each aggregate is then a single bincount over it,
+    so many aggregates of the same selection cost about one scan.
+    Attributes:
+        keys (numpy.ndarray): Label of each group, in sorted key order.
+    """
+
+    def __init__(self, selection, key):
+        self.selection = selection
+        catalog = selection.catalog
+        if key in ('year', 'month'):
+            values, labels = selection.column(key), None
+            values = np.where(selection.valid_date, values, -1)
+        elif key in ('type', 'mag_type'):
+            values = selection.column(key + '_code')
+            labels = getattr(catalog, key + '_names')
+        elif key == 'depth_band':
+            values = np.searchsorted(list(DEPTH_BANDS.values()), selection.depth, side='right')
+            values[np.isnan(selection.depth)] = -1
+            labels = list(DEPTH_BANDS)
+        else:
+            raise ValueError(f"Cannot group by {key!r}")
+        keys, codes = np.unique(values, return_inverse=True)
+        if len(keys) and keys[0] == -1:  # Records without a group
+            keys, codes = keys[1:], codes - 1
+        self._codes = codes.ravel()
+        self.keys = keys if labels is None else np.array([labels[k] for k in keys], dtype=object)
+        self._axis = Axis(edges=np.arange(len(keys) + 1) - 0.5)
+        self._stats = {}  # Column name to BinStats
+        self._sorted = {}  # Column name to values sorted within each group
+
+    def __len__(self):
+        return len(self.keys)
+
+    def stats(self, column='mag'):
+        """
+        Returns:
+            BinStats: Count, sum, mean, min and max of the column in each group.
+        """
+        if column not in self._stats:
+            self._stats[column] = bin_stats([self._codes], [self._axis],
+                                            self.selection.column(column))
+        return self._stats[column]
+
+    def count(self):
+        """
+        Returns:
+            numpy.ndarray: Number of records in each group.
+        """
+        return np.bincount(self._codes[self._codes >= 0], minlength=len(self))
+
+    def mean(self, column='mag'):
+        """
+        Returns:
+            numpy.ndarray: Mean of the column in each group.
+        """
+        return self.stats(column).mean()
+
+    def percentile(self, column='mag', q=50):
+        """
+        Parameters:
+            column (str): Column to aggregate.
+            q (float): Percentile between 0 and 100.
+        Returns:
+            numpy.ndarray: Linearly interpolated percentile of the column in
+                each group, NaN for groups without values.
+        """
+        if not 0 <= q <= 100:  # Ranks outside a group would read other groups
+            raise ValueError("Percentiles must be in the range [0, 100]")
+        if column not in self._sorted:
+            values = self.selection.column(column)
+            keep = (self._codes >= 0) & ~np.isnan(values)
+            codes, values = self._codes[keep], values[keep]
+            order = np.lexsort((values, codes))  # By group, then by value
+            counts = np.bincount(codes, minlength=len(self))
+            self._sorted[column] = (values[order], np.cumsum(counts) - counts, counts)
+        values, starts, counts = self._sorted[column]
+        result = np.full(len(self), np.nan)
+        full = counts > 0
+        at = starts[full] + (counts[full] - 1) * q / 100  # Fractional rank in each group
+        low = np.floor(at).astype(np.int64)
+        high = np.minimum(low + 1, starts[full] + counts[full] - 1)
+        result[full] = values[low] + (values[high] - values[low]) * (at - low)
+        return result
+
+
+def filter_chunks(chunks, bounds):
+    """
+    Applies the filter ranges to each block of a stream.
+    Parameters:
+        chunks (iterable): Catalog blocks, e.g. from iter_chunks.
+        bounds (dict): Column name mapped to a (minimum, maximum) tuple.
+    Yields:
+        Selection: Rows of each block inside every range.
+    """
+    for chunk in chunks:
+        yield Selection(chunk, np.flatnonzero(_in_bounds(chunk, None, bounds)))
+
+
+class RunningAggregates:
+    """
+    Aggregates updated one selection at a time, so memory depends on the
+    number of bins and not on the number of rows.
+    Attributes:
+        rows (int): Number of records added.
+        by_year (BinStats): Magnitude statistics per year in STREAM_YEARS.
+        by_lng (BinStats): Magnitude statistics per longitude bin.
+        first_day, last_day (int or None): Valid date range of the records added.
+    """
+
+    def __init__(self, lng_axis=None):
+        first, last = STREAM_YEARS
+        self.rows = 0
+        self.by_year = BinStats([Axis(edges=np.arange(first, last + 2) - 0.5)])
+        self.by_lng = BinStats([lng_axis or Axis(-180, 180, 6)])
+        self.first_day = self.last_day = None
+
+    def add(self, select):
+        """
+        Adds the records of a selection to the aggregates.
+        Returns:
+            RunningAggregates: self, for chaining.
+        """
+        self.rows += len(select)
+        valid = select.valid_date
+        self.by_year.add([select.year[valid]], select.mag[valid])
+        self.by_lng.add([select.lng], select.mag)
+        dates = select.date_range()
+        if dates is not None:
+            self.first_day = dates[0] if self.first_day is None else min(self.first_day, dates[0])
+            self.last_day = dates[1] if self.last_day is None else max(self.last_day, dates[1])
+        return self
+
+    def arrays(self):
+        """
+        Returns:
+            dict: Plain arrays holding the aggregates, for saving with np.savez.
+        """
+        arrays = {'rows': self.rows, 'lng_edges': self.by_lng.axes[0].edges,
+                  'days': [-1 if self.first_day is None else self.first_day,
+                           -1 if self.last_day is None else self.last_day]}
+        for name, stats in (('year', self.by_year), ('lng', self.by_lng)):
+            arrays.update({f"{name}_count": stats.count, f"{name}_sum": stats.sum,
+                           f"{name}_min": stats._min, f"{name}_max": stats._max})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Parameters:
+            arrays (dict): Arrays returned by arrays(), or the loaded npz file.
+        Returns:
+            RunningAggregates: The aggregates the arrays were saved from.
+        """
+        totals = cls(Axis(edges=arrays['lng_edges']))
+        totals.rows = int(arrays['rows'])
+        first, last = (int(day) for day in arrays['days'])
+        totals.first_day, totals.last_day = (None, None) if first == -1 else (first, last)
+        for name, stats in (('year', totals.by_year), ('lng', totals.by_lng)):
+            stats.count, stats.sum = arrays[f"{name}_count"], arrays[f"{name}_sum"]
+            stats._min, stats._max = arrays[f"{name}_min"], arrays[f"{name}_max"]
+        return totals
+
+    def years(self):
+        """
+        Returns:
+            tuple: (years, counts, mean magnitudes) of the years holding records.
+        """
+        counts = self.by_year.count
+        held = counts > 0
+        years = np.arange(STREAM_YEARS[0], STREAM_YEARS[1] + 1)
+        return years[held], counts[held], self.by_year.mean()[held]
+
+
+def stream_aggregates(path=EARTHQUAKE_FILE, bounds=None, lng_axis=None, chunk_rows=CHUNK_ROWS):
+    """
+    Filters and aggregates a catalog too large to load, one block at a time.
+    Parameters:
+        path (str): Path of the earthquake CSV file.
+        bounds (dict): Column name mapped to a (minimum, maximum) tuple.
+        lng_axis (Axis): Longitude bins, six equal bins over the globe by default.
+        chunk_rows (int): Number of rows parsed at a time.
+    Returns:
+        RunningAggregates: Aggregates of the records inside every range.
+    """
+    totals = RunningAggregates(lng_axis)
+    for select in filter_chunks(iter_chunks(path, chunk_rows), bounds or {}):
+        totals.add(select)
+    return totals
+
+
+class FilterChain:
+    """
+    The filter stages (latitude, longitude, date, magnitude) as a query plan
+    that remembers the result of each stage. A stage's result is keyed by its
+    bounds and those of the stages before it, so re-running a stage with the
+    same bounds returns at once, tightening a range filters only the earlier
+    wider result, and loosening one starts again from the cached result of
+    the previous stage.
+    Attributes:
+        catalog (Catalog): Catalog being filtered.
+        bounds (list): Current (minimum, maximum) of each stage, None when unset.
+    """
+
+    def __init__(self, catalog, stages=CHAIN_STAGES):
+        self.catalog = catalog
+        self.stages = tuple(stages)
+        self.bounds = [None] * len(self.stages)
+        self._results = {}  # Bounds of stages 0..i to the Selection after stage i
+
+    def _key(self, stage):
+        return tuple(self.bounds[:stage + 1])
+
+    def result(self, stage):
+        """
+        Parameters:
+            stage (int): Stage number, -1 for the unfiltered catalog.
+        Returns:
+            Selection: Records left after the stage with the current bounds.
+        """
+        if stage < 0:
+            return self.catalog.all()
+        key = self._key(stage)
+        if key not in self._results:
+            parent = self.result(stage - 1)  # Reused when only this stage changed
+            bounds = self.bounds[stage]
+            if bounds is None:  # Stage not set yet: nothing to filter
+                selected = parent
+            else:
+                selected = self._narrowest(stage, bounds, parent).where(
+                    **{self.stages[stage]: bounds})
+            self._remember(key, selected)
+        return self._results[key]
+
+    def _narrowest(self, stage, bounds, parent):
+        """
+        Returns:
+            Selection: Smallest cached result of this stage, with the same
+                earlier bounds, whose range contains the new bounds; the parent
+                result when there is none.
+        """
+        prefix = self._key(stage - 1) if stage else ()
+        best = parent
+        for key, selected in self._results.items():
+            if (len(key) == stage + 1 and key[:-1] == prefix and key[-1] is not None
+                    and key[-1][0] <= bounds[0] and bounds[1] <= key[-1][1]
+                    and len(selected) < len(best)):
+                best = selected
+        return best
+
+    def _remember(self, key, selected):
+        if len(self._results) >= CHAIN_CACHE:  # Drop the oldest result
+            del self._results[next(iter(self._results))]
+        self._results[key] = selected
+
+    def apply(self, name, low, high):
+        """
+        Sets the range of one stage and filters it.
+        Parameters:
+            name (str): Stage column, one of the chain stages.
+            low, high (float): Inclusive range of the stage.
+        Returns:
+            Selection: Records left after that stage.
+        """
+        number = self.stages.index(name)
+        self.bounds[number] = (low, high)
+        with metrics.stage('filter ' + name, len(self.result(number - 1))) as timed:
+            selected = self.result(number)
+            timed.rows_out = len(selected)
+        return selected
+
+    def selection(self):
+        """
+        Returns:
+            Selection: Records left after every stage.
+        """
+        return self.result(len(self.stages) - 1)
@@ -0,0 +1,19 @@
+'''
+Program: Earthquake constants
+Author: Prashanth Reddy Loka
+Description: Plain settings shared by the earthquake modules, kept apart from
+        earthquake_catalog so that code needing only these values, such as
+        the date checks and option defaults of EarthquakeDatavisualization,
+        does not load NumPy. earthquake_catalog imports them, so they can
+        still be imported from there.
+Revisions: 00 - Data files, epoch, chunk size and sequence window defaults
+'''
+# Import necessary libraries
+from datetime import datetime as dt  # For the day numbering epoch
+
+EARTHQUAKE_FILE = "earthquakesF23.csv"  # Default earthquake catalog
+CITIES_FILE = "worldcitiesF23.csv"  # Default world cities table
+CHUNK_ROWS = 65536  # Number of CSV rows converted to arrays at a time
+EPOCH = dt(1970, 1, 1)  # Day 0 of the day column
+SEQUENCE_KM = 100.0  # Default distance of an aftershock from its mainshock
+SEQUENCE_DAYS = 30  # Default days between an aftershock and its mainshock
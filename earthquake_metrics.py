@@ -0,0 +1,209 @@
+'''
+Program: Earthquake pipeline metrics
+Author: Prashanth Reddy Loka
+Description: Optional timing and counter instrumentation for the earthquake
+        pipeline. Loading, each filter, each aggregation and each plot run
+        inside a stage that records its wall time, rows in and out and the
+        peak resident memory of the process so far. Metrics are switched on
+        with the EARTHQUAKE_METRICS environment variable (or the --metrics
+        option): '-' prints one log line per stage, any other value is a file
+        that receives one JSON object per stage. When they are off a stage is
+        a shared do-nothing object, so the instrumented code pays for one
+        flag test. EARTHQUAKE_METRICS_MEMORY=1 (or --metrics-memory) also
+        traces Python allocations for each stage's own peak; tracing makes
+        allocation-heavy stages such as CSV parsing and plotting ten or more
+        times slower while NumPy stages barely change, so its timings are
+        not comparable with untraced ones.
+Revisions: 00 - Per-stage wall time, row counts and peak memory
+           01 - Peak resident memory by default; allocation tracing is opt-in
+'''
+# Import necessary libraries
+import json  # For the JSON lines report
+import os  # For the environment switch and process id
+try:
+    import resource  # For the peak resident memory; not available on Windows
+except ImportError:
+    resource = None
+import sys  # For the log lines
+import time  # For the wall time of each stage
+import tracemalloc  # For the peak memory of each stage
+
+METRICS_ENV = "EARTHQUAKE_METRICS"  # Environment variable switching metrics on
+MEMORY_ENV = "EARTHQUAKE_METRICS_MEMORY"  # Environment variable switching tracing on
+LOG_TARGET = "-"  # Target printing log lines instead of writing a JSON file
+# ru_maxrss is in kibibytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+_target = None  # Where finished stages go, None when metrics are off
+_tracing = False  # Whether Python allocations are traced for per-stage peaks
+_open = []  # Stages currently running, outermost first
+
+
+class _Off:
+    """
+    Stage used while metrics are off: entering and leaving it does nothing.
+    """
+    __slots__ = ('rows_out',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_OFF = _Off()
+
+
+class Stage:
+    """
+    One timed step of the pipeline, used as a context manager.
+    Attributes:
+        name (str): Stage name, such as 'filter lat' or 'plot locations'.
+        rows_in (int): Rows the stage started from, None when not counted.
+        rows_out (int): Rows the stage produced; set inside the with block.
+        seconds (float): Wall time, known once the stage has finished.
+        peak_rss (int): Peak resident memory of the process in bytes when the
+            stage finished, None where the platform does not report it.
+        peak (int): Peak traced memory in bytes while the stage ran, None
+            unless allocation tracing is on.
+    """
+    __slots__ = ('name', 'rows_in', 'rows_out', 'seconds', 'peak_rss', 'peak', '_start')
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.peak_rss = None
+        self.peak = 0 if _tracing else None
+
+    def __enter__(self):
+        if _tracing:
+            _sync_peak()
+        _open.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        if _tracing:
+            _sync_peak()
+        self.peak_rss = _peak_rss()
+        _open.remove(self)
+        _emit(self)
+        return False
+
+    def record(self):
+        """
+        Returns:
+            dict: The stage as a JSON-ready dictionary.
+        """
+        return {'stage': self.name, 'seconds': round(self.seconds, 6),
+                'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                'peak_rss_bytes': self.peak_rss, 'peak_bytes': self.peak,
+                'parent': _open[-1].name if _open else None, 'pid': os.getpid()}
+
+
+def _peak_rss():
+    """
+    Returns:
+        int: Peak resident memory of this process in bytes, or None.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def _sync_peak():
+    """
+    Credits the traced memory peak since the last call to every running
+    stage, then starts a new peak, so nested stages each see their own.
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    for running in _open:
+        if running.peak is not None:  # Stages started before tracing have none
+            running.peak = max(running.peak, peak)
+    tracemalloc.reset_peak()
+
+
+def _emit(finished):
+    """
+    Sends a finished stage to the log or appends it to the JSON lines file.
+    """
+    record = finished.record()
+    if _target == LOG_TARGET:
+        rows = '' if finished.rows_out is None else f" rows {finished.rows_out}"
+        if finished.rows_in is not None:
+            rows = f" rows {finished.rows_in} -> {finished.rows_out}"
+        memory = '' if finished.peak_rss is None else f" rss {finished.peak_rss / 2 ** 20:.1f} MiB"
+        if finished.peak is not None:
+            memory += f" traced peak {finished.peak / 2 ** 20:.1f} MiB"
+        print(f"[metrics] {finished.name}: {finished.seconds * 1000:.1f} ms{rows}{memory}",
+              file=sys.stderr)
+    else:
+        # One short append per stage, so worker processes can share the file
+        with open(_target, 'a') as report:
+            report.write(json.dumps(record) + '\n')
+
+
+def enable(target=LOG_TARGET, memory=False):
+    """
+    Switches metrics on for this process and the worker processes it starts.
+    Parameters:
+        target (str): '-' for log lines, otherwise the JSON lines file.
+        memory (bool): True to also trace Python allocations for the peak
+            of each stage, which slows allocation-heavy stages a lot.
+    Returns:
+        None
+    """
+    global _target, _tracing
+    _target = target
+    os.environ[METRICS_ENV] = target  # Inherited by worker processes
+    if memory:
+        os.environ[MEMORY_ENV] = '1'
+        _tracing = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def enabled():
+    """
+    Returns:
+        bool: True while metrics are being recorded.
+    """
+    return _target is not None
+
+
+def stage(name, rows_in=None):
+    """
+    Times one step of the pipeline.
+        with stage('filter mag', len(select)) as s:
+            select = select.where(mag=(6, 9.1))
+            s.rows_out = len(select)
+    Parameters:
+        name (str): Stage name.
+        rows_in (int): Rows the stage starts from.
+    Returns:
+        Stage: Context manager for the stage; a shared do-nothing object
+            when metrics are off.
+    """
+    if _target is None:
+        return _OFF
+    return Stage(name, rows_in)
+
+
+def read_report(path):
+    """
+    Reads a JSON lines metrics file.
+    Parameters:
+        path (str): File given as the metrics target.
+    Returns:
+        list: One dictionary per finished stage, in the order they finished.
+    """
+    with open(path, 'r') as report:
+        return [json.loads(line) for line in report if line.strip()]
+
+
+if os.environ.get(METRICS_ENV):  # Switched on by the environment
+    enable(os.environ[METRICS_ENV], os.environ.get(MEMORY_ENV, '') not in ('', '0'))
@@ -0,0 +1,328 @@
+'''
+Program: Earthquake query service
+Author: Prashanth Reddy Loka
+Description: A long-running local service that loads and indexes the
+        earthquake catalog and the world cities table once, then answers
+        filter, group-by, binning and nearest-city queries as JSON over HTTP
+        on a local port or a Unix socket. Ranges use the same options as the
+        interactive stages and --batch queries (lat, lng, dates, mag):
+            GET /filter?lat=-10,40&dates=01/01/1990,12/31/2000
+            GET /group_by?key=year&column=mag&mag=6,9.1
+            GET /bins?column=lng&low=-180&high=180&count=6&values=mag
+            GET /nearest?lat=30,46&lng=128,146&top=5
+        Queries run concurrently on a thread pool, and answers are kept in
+        an LRU cache keyed by the normalized query.
+Revisions: 00 - asyncio HTTP service with an LRU result cache
+           01 - /bins rejects empty or reversed ranges and bad bin counts
+           02 - Negative limit and top options are rejected
+           03 - Percentiles outside 0 to 100 are rejected; unexpected errors answer 500
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+import asyncio  # For serving many connections at once
+from collections import OrderedDict  # For the LRU result cache
+from datetime import timedelta  # For printing day numbers as dates
+import json  # For the answers
+import traceback  # For logging unexpected errors
+from urllib.parse import parse_qsl, urlsplit  # For the query string
+import numpy as np  # For the catalog columns
+from earthquake_cache import cached_catalog, cached_cities
+from earthquake_catalog import CHAIN_STAGES, CITIES_FILE, EARTHQUAKE_FILE, EPOCH, Axis
+from EarthquakeDatavisualization import query_bounds
+
+SERVICE_HOST = "127.0.0.1"  # Local connections only
+SERVICE_PORT = 8765  # Default port
+CACHE_SIZE = 256  # Answers kept in the LRU cache
+MAX_ROWS = 10000  # Largest number of records /filter returns with fields=
+MAX_BINS = 10000  # Most bins /bins divides a range into
+MAX_HEADER = 65536  # Longest request head accepted, in bytes
+RANGES = ('lat', 'lng', 'dates', 'mag')  # Query options read as minimum,maximum
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+def _plain(values):
+    """
+    Returns:
+        list: Array values as JSON numbers and strings, NaN as null.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return [None if np.isnan(v) else float(v) for v in values]
+    return values.tolist()
+
+
+def _date(day):
+    """
+    Returns:
+        str: 'mm/dd/yyyy' of a day number.
+    """
+    return (EPOCH + timedelta(days=int(day))).strftime('%m/%d/%Y')
+
+
+class QueryService:
+    """
+    Answers queries over one loaded catalog and cities table.
+    Attributes:
+        catalog (Catalog): Earthquake catalog, indexed at start.
+        cities (CityTable): World cities table.
+        hits, misses (int): LRU cache statistics.
+    """
+    # Columns a query may aggregate or return
+    COLUMNS = ('lat', 'lng', 'depth', 'mag', 'day', 'year', 'month')
+
+    def __init__(self, catalog, cities, cache_size=CACHE_SIZE):
+        self.catalog = catalog
+        self.cities = cities
+        self.cache_size = cache_size
+        self.hits = self.misses = 0
+        self._results = OrderedDict()  # Normalized query to answer, oldest first
+        for name in CHAIN_STAGES:  # Build the indexes before the first query
+            catalog.index.sorted(name)
+        catalog.index.grid
+        cities.grid
+
+    def _column(self, params, option, default):
+        name = params.get(option, default)
+        if name not in self.COLUMNS:
+            raise ValueError(f"Unknown column {name!r}")
+        return name
+
+    def select(self, params):
+        """
+        Parameters:
+            params (dict): Query options; lat, lng, dates and mag are
+                'minimum,maximum' ranges.
+        Returns:
+            Selection: Records inside every range given.
+        """
+        ranges = {option: params[option].split(',') for option in RANGES if option in params}
+        for option, values in ranges.items():
+            if len(values) != 2:
+                raise ValueError(f"{option} must be minimum,maximum")
+        return self.catalog.all().where(**query_bounds(ranges))
+
+    def filter(self, params):
+        """
+        Returns:
+            dict: Number and date range of the selected records; with
+                fields=lat,lng,... also their values, up to limit records.
+        """
+        select = self.select(params)
+        dates = select.date_range()
+        answer = {'count': len(select),
+                  'dates': None if dates is None else [_date(day) for day in dates]}
+        if params.get('fields'):
+            limit = int(params.get('limit', MAX_ROWS))
+            if limit < 0:  # A negative slice would pass the MAX_ROWS cap
+                raise ValueError("limit must not be negative")
+            limit = min(limit, MAX_ROWS)
+            fields = [self._column({'f': name}, 'f', None) for name in params['fields'].split(',')]
+            answer['records'] = {name: _plain(select.column(name)[:limit]) for name in fields}
+        return answer
+
+    def group_by(self, params):
+        """
+        Returns:
+            dict: Keys of the groups and the count, mean, minimum and maximum
+                of a column in each; with q= also that percentile.
+        """
+        column = self._column(params, 'column', 'mag')
+        groups = self.select(params).group_by(params.get('key', 'year'))
+        stats = groups.stats(column)
+        answer = {'keys': _plain(groups.keys), 'count': _plain(groups.count()),
+                  'mean': _plain(stats.mean()), 'min': _plain(stats.min),
+                  'max': _plain(stats.max)}
+        if 'q' in params:
+            q = float(params['q'])
+            if not 0 <= q <= 100:
+                raise ValueError("q must be between 0 and 100")
+            answer['percentile'] = _plain(groups.percentile(column, q))
+        return answer
+
+    def bins(self, params):
+        """
+        Returns:
+            dict: Edges of count equal bins of a column over [low, high], and
+                the count, mean, minimum and maximum of values in each.
+        """
+        column = self._column(params, 'column', 'lng')
+        values = self._column(params, 'values', 'mag')
+        low, high = float(params['low']), float(params['high'])
+        count = int(params.get('count', 10))
+        if not 1 <= count <= MAX_BINS:
+            raise ValueError(f"count must be between 1 and {MAX_BINS}")
+        if not (np.isfinite(low) and np.isfinite(high) and high > low):
+            raise ValueError("low and high must be numbers with high above low")
+        axis = Axis(low, high, count)
+        stats = self.select(params).bins({column: axis}, values)
+        return {'edges': _plain(axis.edges), 'count': _plain(stats.count),
+                'mean': _plain(stats.mean()), 'min': _plain(stats.min),
+                'max': _plain(stats.max)}
+
+    def nearest(self, params):
+        """
+        Returns:
+            dict: Cities nearest to the most selected records, with their
+                number of records and median distance.
+        """
+        select = self.select(params)
+        city, km = self.cities.nearest(select.lat, select.lng)
+        top = int(params.get('top', 5))
+        if top < 0:
+            raise ValueError("top must not be negative")
+        ids, counts = np.unique(city[city >= 0], return_counts=True)
+        top = np.argsort(-counts, kind='stable')[:top]
+        return {'cities': [{'name': str(self.cities.name[ids[i]]),
+                            'country': str(self.cities.country[ids[i]]),
+                            'count': int(counts[i]),
+                            'median_km': float(np.median(km[city == ids[i]]))}
+                           for i in top]}
+
+    def answer(self, path, params):
+        """
+        Computes the answer of one query, without the cache.
+        Parameters:
+            path (str): '/filter', '/group_by', '/bins' or '/nearest'.
+            params (dict): Query options.
+        Returns:
+            dict: JSON-ready answer, or None for an unknown path.
+        """
+        handler = {'/filter': self.filter, '/group_by': self.group_by,
+                   '/bins': self.bins, '/nearest': self.nearest}.get(path)
+        return None if handler is None else handler(params)
+
+    async def cached_answer(self, path, params):
+        """
+        Answers a query from the LRU cache, or on the thread pool.
+        Returns:
+            dict: JSON-ready answer, or None for an unknown path.
+        """
+        key = (path, tuple(sorted(params.items())))
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+        self.misses += 1
+        answer = await asyncio.get_running_loop().run_in_executor(None, self.answer,
+                                                                  path, params)
+        if answer is not None:
+            self._results[key] = answer
+            if len(self._results) > self.cache_size:
+                self._results.popitem(last=False)  # Least recently used
+        return answer
+
+    def status(self):
+        """
+        Returns:
+            dict: Table sizes and cache statistics.
+        """
+        return {'records': len(self.catalog), 'cities': len(self.cities),
+                'cached': len(self._results), 'hits': self.hits, 'misses': self.misses}
+
+
+async def _respond(writer, code, body, keep_alive):
+    """
+    Writes one JSON response.
+    """
+    data = json.dumps(body).encode()
+    writer.write(f"HTTP/1.1 {code} {REASONS[code]}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+    await writer.drain()
+
+
+async def handle(service, reader, writer):
+    """
+    Serves the requests of one connection, several when it is kept alive.
+    Parameters:
+        service (QueryService): Service answering the queries.
+        reader, writer: asyncio streams of the connection.
+    """
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                break  # Connection closed, or a request head too long
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, version = lines[0].split(' ')
+            except ValueError:
+                await _respond(writer, 400, {'error': 'Malformed request line'}, False)
+                break
+            headers = {name.strip().lower(): value.strip()
+                       for name, _, value in (line.partition(':') for line in lines[1:] if line)}
+            keep_alive = (headers.get('connection', '').lower() != 'close' and
+                          version == 'HTTP/1.1')
+            if method != 'GET':
+                await _respond(writer, 405, {'error': 'Only GET is supported'}, False)
+                break
+            url = urlsplit(target)
+            params = dict(parse_qsl(url.query))
+            if url.path == '/status':
+                code, body = 200, service.status()
+            else:
+                try:
+                    body = await service.cached_answer(url.path, params)
+                    code = 200 if body is not None else 404
+                    body = body if body is not None else {'error': f"Unknown path {url.path}"}
+                except (KeyError, TypeError, ValueError) as error:  # Bad or missing option
+                    code, body = 400, {'error': str(error)}
+                except Exception:  # A bug: log it, but still answer the client
+                    traceback.print_exc()
+                    code, body = 500, {'error': 'Internal error'}
+            await _respond(writer, code, body, keep_alive)
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host=SERVICE_HOST, port=SERVICE_PORT, unix=None):
+    """
+    Runs the service until it is stopped.
+    Parameters:
+        service (QueryService): Service answering the queries.
+        host, port: TCP address to listen on.
+        unix (str): Unix socket path to listen on instead of TCP.
+    """
+    def connected(reader, writer):
+        return handle(service, reader, writer)
+    if unix:
+        server = await asyncio.start_unix_server(connected, unix, limit=MAX_HEADER)
+    else:
+        server = await asyncio.start_server(connected, host, port, limit=MAX_HEADER)
+    print(f"Serving {len(service.catalog)} records on {unix or f'http://{host}:{port}'}",
+          flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Earthquake query service")
+    parser.add_argument('--file', default=EARTHQUAKE_FILE, help="earthquake CSV file")
+    parser.add_argument('--cities', default=CITIES_FILE, help="world cities CSV file")
+    parser.add_argument('--host', default=SERVICE_HOST, help="address to listen on")
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help="port to listen on")
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help="answers kept in the LRU cache")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    service = QueryService(cached_catalog(args.file), cached_cities(args.cities),
+                           args.cache_size)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,174 @@
+'''
+Program: 2048 game core
+Author: Prashanth Reddy Loka
+Description: The state and rules of one 2048 game without any window, so
+        games can be played by a program, simulated at full speed and run
+        side by side in one process. Each Game holds its packed board, score,
+        own random source and win and game over flags; step plays one move
+        with the rules of bitboard_2048. Every game has a seed and keeps the
+        moves that changed its board, so it can be recorded and replayed
+        (recording_2048). 2048_game_python.py is a view over a Game.
+            game = Game(seed=7)
+            moved, reward, done = game.step(LEFT)
+Revisions: 00 - Game class with seeded tiles and step
+           01 - Every game has a seed and a move history
+           02 - Seeds must fit the 64 bits a recording stores
+'''
+# Import necessary libraries
+import argparse  # For the error of a bad --seed option
+import random  # For each game's own random source
+from bitboard_2048 import (DIRECTIONS, DOWN, LEFT, RIGHT, UP, add_new_tile,
+                           check_game_over, check_win, max_exponent, move, to_grid)
+
+START_TILES = 2  # Tiles placed when a game starts
+SEED_BITS = 63  # Size of the seeds drawn for games started without one
+SEED_LIMIT = 1 << 64  # Seeds run from 0 to SEED_LIMIT - 1, the range a recording stores
+
+
+def check_seed(seed):
+    """
+    Returns:
+        int: The seed, when it is between 0 and SEED_LIMIT - 1; raises
+            ValueError otherwise.
+    """
+    if not 0 <= seed < SEED_LIMIT:
+        raise ValueError(f"Seed {seed} is not between 0 and 2**64 - 1")
+    return seed
+
+
+def seed_option(text):
+    """
+    Reads a --seed command line option.
+    Returns:
+        int: Seed between 0 and SEED_LIMIT - 1.
+    """
+    try:
+        return check_seed(int(text))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
+
+class Game:
+    """
+    One game of 2048.
+    Attributes:
+        board (int): Packed board of bitboard_2048.
+        score (int): Sum of the tiles merged so far.
+        rng (random.Random): Random source placing the new tiles.
+        seed (int): Seed the random source started from.
+        moves (int): Moves that changed the board.
+        history (bytearray): Direction of each move that changed the board.
+        win (bool): True once a 2048 tile is on the board.
+        game_over (bool): True once no move is possible.
+    """
+    __slots__ = ('board', 'score', 'rng', 'seed', 'moves', 'history', 'win', 'game_over')
+
+    def __init__(self, seed=None):
+        self.rng = random.Random()  # Seeded from the system for the first drawn seed
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        Starts a new game with two tiles.
+        Parameters:
+            seed (int): Seed of the new game's tiles, 0 to SEED_LIMIT - 1, or
+                None to draw one from the random source, so a series of
+                games is reproducible.
+        """
+        if seed is None:
+            seed = self.rng.getrandbits(SEED_BITS)
+        self.seed = check_seed(seed)
+        self.rng.seed(seed)
+        self.board = 0
+        self.score = self.moves = 0
+        self.history = bytearray()
+        for _ in range(START_TILES):
+            self.board = add_new_tile(self.board, self.rng)
+        self.win = check_win(self.board)
+        self.game_over = check_game_over(self.board)
+
+    @property
+    def done(self):
+        """
+        bool: True when the game has been won or lost; moves are ignored.
+        """
+        return self.win or self.game_over
+
+    @property
+    def grid(self):
+        """
+        list: Rows of tile values, 0 for empty.
+        """
+        return to_grid(self.board)
+
+    @property
+    def max_tile(self):
+        """
+        int: Value of the largest tile.
+        """
+        return 1 << max_exponent(self.board)
+
+    def step(self, direction):
+        """
+        Plays one move; when the board changes a new tile is placed.
+        Parameters:
+            direction (int): LEFT, RIGHT, UP or DOWN.
+        Returns:
+            tuple: (moved, reward, done): whether the board changed, the score
+                the move gained and whether the game has ended.
+        """
+        if self.win or self.game_over:
+            return False, 0, True
+        board, reward = move(self.board, direction)
+        if board == self.board:
+            return False, 0, False
+        self.board = add_new_tile(board, self.rng)
+        self.score += reward
+        self.moves += 1
+        self.history.append(direction)
+        self.win = check_win(self.board)
+        self.game_over = check_game_over(self.board)
+        return True, reward, self.win or self.game_over
+
+    def copy(self):
+        """
+        Returns:
+            Game: Independent game in the same state, with a copy of the
+                random source.
+        """
+        game = Game.__new__(Game)
+        for name in Game.__slots__:
+            setattr(game, name, getattr(self, name))
+        game.rng = random.Random()
+        game.rng.setstate(self.rng.getstate())
+        game.history = bytearray(self.history)
+        return game
+
+
+def play(policy, seed=None, max_moves=None):
+    """
+    Plays one game headless.
+    Parameters:
+        policy: Function of a Game returning the direction to move.
+        seed (int): Seed of the game's tiles, None to draw one.
+        max_moves (int): Moves after which the game is stopped, None for no limit.
+    Returns:
+        Game: The finished game.
+    """
+    game = Game(seed)
+    tries = 0  # Moves in a row that did not change the board
+    while not game.done and (max_moves is None or game.moves < max_moves):
+        moved = game.step(policy(game))[0]
+        tries = 0 if moved else tries + 1
+        if tries > 1000:  # The policy keeps choosing a blocked direction
+            break
+    return game
+
+
+def random_policy(game):
+    """
+    Returns:
+        int: A random direction; the game's own random source is left to
+            the tiles.
+    """
+    return random.choice(DIRECTIONS)
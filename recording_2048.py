@@ -0,0 +1,245 @@
+'''
+Program: 2048 game recordings
+Author: Prashanth Reddy Loka
+Description: Saves 2048 games in a compact binary file and replays them
+        headless. A game is its seed and its moves, two bits each; optional
+        spawn records (one byte per new tile: cell and 2 or 4) make a game
+        replayable without the random source, for games played elsewhere.
+        A recording file is a header followed by one record per game:
+            flags (1 byte), seed (8 bytes), moves (4 bytes), packed moves,
+            then with FLAG_SPAWNS one spawn byte per tile placed
+        Games are appended as they finish and read back one record at a
+        time, so archives of any size replay in bounded memory:
+            python recording_2048.py games/*.rec --workers 8
+Revisions: 00 - Binary game records, streaming reader and batch replay
+           01 - Records reject seeds the seed field cannot hold
+'''
+# Import necessary libraries
+import argparse  # For the command line options
+from collections import Counter  # For the largest tile of each game
+import random  # For replaying the tiles of a seed
+import struct  # For the record layout
+import time  # For the moves per second
+from bitboard_2048 import (WIN_EXPONENT, add_new_tile, check_game_over, check_win,
+                           max_exponent, move)
+from game_2048 import START_TILES, check_seed
+
+MAGIC = b'2048REC\x01'  # File header, with the format version
+RECORD = struct.Struct('<BQI')  # Flags, seed, number of moves
+FLAG_SPAWNS = 1  # The record carries one spawn byte per tile placed
+
+
+class GameRecord:
+    """
+    One recorded game.
+    Attributes:
+        seed (int): Seed of the game's tiles.
+        moves (bytes): Direction of each move that changed the board.
+        spawns (bytes): Tiles placed, cell | (exponent - 1) << 4 each,
+            None when the tiles follow from the seed.
+    """
+    __slots__ = ('seed', 'moves', 'spawns')
+
+    def __init__(self, seed, moves, spawns=None):
+        self.seed = check_seed(seed)  # Fails here, not when the record is written
+        self.moves = bytes(moves)
+        self.spawns = None if spawns is None else bytes(spawns)
+
+    @classmethod
+    def of(cls, game, spawns=False):
+        """
+        Parameters:
+            game (Game): Game of game_2048.
+            spawns (bool): True to store the tiles placed as well.
+        Returns:
+            GameRecord: Record of the game so far.
+        """
+        record = cls(game.seed, game.history)
+        if spawns:
+            record.spawns = replay(record, with_spawns=True)['spawns']
+        return record
+
+
+def pack_moves(moves):
+    """
+    Returns:
+        bytes: Four directions per byte, the first in the low bits.
+    """
+    packed = bytearray((len(moves) + 3) // 4)
+    for n, direction in enumerate(moves):
+        packed[n >> 2] |= direction << (2 * (n & 3))
+    return bytes(packed)
+
+
+def unpack_moves(packed, count):
+    """
+    Returns:
+        bytes: The first count directions of packed moves.
+    """
+    return bytes((packed[n >> 2] >> (2 * (n & 3))) & 3 for n in range(count))
+
+
+def encode(record):
+    """
+    Returns:
+        bytes: A game record in the file layout.
+    """
+    flags = 0 if record.spawns is None else FLAG_SPAWNS
+    data = RECORD.pack(flags, record.seed, len(record.moves)) + pack_moves(record.moves)
+    return data if record.spawns is None else data + record.spawns
+
+
+def append_games(path, records):
+    """
+    Appends game records to a recording file, creating it when missing.
+    Parameters:
+        path (str): Recording file.
+        records: GameRecord objects.
+    """
+    with open(path, 'ab') as out:
+        if out.tell() == 0:
+            out.write(MAGIC)
+        for record in records:
+            out.write(encode(record))
+
+
+def read_games(path):
+    """
+    Reads a recording file one game at a time.
+    Parameters:
+        path (str): Recording file.
+    Yields:
+        GameRecord: Each game in the order it was saved.
+    """
+    with open(path, 'rb') as data:
+        if data.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a 2048 recording")
+        while True:
+            head = data.read(RECORD.size)
+            if not head:
+                return
+            if len(head) < RECORD.size:
+                raise ValueError(f"{path} ends inside a record")
+            flags, seed, count = RECORD.unpack(head)
+            packed = data.read((count + 3) // 4)
+            spawns = data.read(count + START_TILES) if flags & FLAG_SPAWNS else None
+            if len(packed) < (count + 3) // 4 or (spawns is not None and
+                                                  len(spawns) < count + START_TILES):
+                raise ValueError(f"{path} ends inside a record")
+            yield GameRecord(seed, unpack_moves(packed, count), spawns)
+
+
+def _place(board, spawn):
+    """
+    Returns:
+        int: Board with the tile of a spawn byte placed.
+    """
+    shift = 4 * (spawn & 0xF)
+    if (board >> shift) & 0xF:
+        raise ValueError("Recorded tile placed on a full cell")
+    return board | ((spawn >> 4) + 1) << shift
+
+
+def replay(record, with_spawns=False):
+    """
+    Plays a recorded game again on a packed board.
+    Parameters:
+        record (GameRecord): Game to replay.
+        with_spawns (bool): True to return the tiles placed as spawn bytes.
+    Returns:
+        dict: Final board, score, largest tile, moves, win and game over
+            flags, and with with_spawns the spawn bytes.
+    """
+    rng = random.Random(record.seed)
+    spawns = iter(record.spawns) if record.spawns is not None else None
+    placed = bytearray() if with_spawns else None
+    board = 0
+    score = 0
+    for n in range(START_TILES + len(record.moves)):
+        if n >= START_TILES:
+            moved, gained = move(board, record.moves[n - START_TILES])
+            if moved == board:
+                raise ValueError(f"Move {n - START_TILES} does not change the board")
+            board, score = moved, score + gained
+        if spawns is not None:
+            new = _place(board, next(spawns))
+        else:
+            new = add_new_tile(board, rng)
+        if placed is not None:
+            cell = ((new ^ board).bit_length() - 1) // 4  # The one cell that changed
+            placed.append(cell | (((new >> (4 * cell)) & 0xF) - 1) << 4)
+        board = new
+    result = {'board': board, 'score': score, 'max_tile': 1 << max_exponent(board),
+              'moves': len(record.moves), 'win': check_win(board),
+              'game_over': check_game_over(board)}
+    if with_spawns:
+        result['spawns'] = bytes(placed)
+    return result
+
+
+def replay_file(path):
+    """
+    Replays every game of one recording file.
+    Parameters:
+        path (str): Recording file.
+    Returns:
+        dict: Number of games, moves, total score, games reaching 2048 and
+            the count of each largest tile.
+    """
+    stats = {'games': 0, 'moves': 0, 'score': 0, 'wins': 0, 'max_tiles': Counter()}
+    for record in read_games(path):
+        result = replay(record)
+        stats['games'] += 1
+        stats['moves'] += result['moves']
+        stats['score'] += result['score']
+        stats['wins'] += result['max_tile'] >= 1 << WIN_EXPONENT
+        stats['max_tiles'][result['max_tile']] += 1
+    return stats
+
+
+def replay_files(paths, workers=None):
+    """
+    Replays recording files, one file per task in a process pool.
+    Parameters:
+        paths (list): Recording files.
+        workers (int): Worker processes, None for one per core, 1 for none.
+    Yields:
+        tuple: (path, replay_file statistics) as each file finishes, in order.
+    """
+    if workers == 1:
+        for path in paths:
+            yield path, replay_file(path)
+        return
+    from concurrent.futures import ProcessPoolExecutor  # For replaying files in parallel
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(paths, pool.map(replay_file, paths))
+
+
+def parse_args(argv=None):
+    """
+    Reads the command line options.
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Replay 2048 game recordings")
+    parser.add_argument('files', nargs='+', help="recording files")
+    parser.add_argument('--workers', type=int, help="worker processes, one per core if omitted")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.perf_counter()
+    total = {'games': 0, 'moves': 0, 'score': 0, 'wins': 0, 'max_tiles': Counter()}
+    for path, stats in replay_files(args.files, args.workers):
+        print(f"{path}: {stats['games']} games, {stats['wins']} reached 2048")
+        for name in ('games', 'moves', 'score', 'wins', 'max_tiles'):
+            total[name] += stats[name]
+    seconds = time.perf_counter() - start
+    games = max(total['games'], 1)
+    print(f"{total['games']} games, {total['moves']} moves in {seconds:.1f} s "
+          f"({total['moves'] / seconds:.0f} moves/s)")
+    print(f"Reached 2048: {total['wins']} ({100 * total['wins'] / games:.1f}%)")
+    print(f"Average score: {total['score'] / games:.0f}")
+    for tile, count in sorted(total['max_tiles'].items()):
+        print(f"  largest tile {tile:5d}: {count}")
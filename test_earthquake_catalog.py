@@ -0,0 +1,40 @@
+'''
+Program: Earthquake catalog tests
+Author: Prashanth Reddy Loka
+Description: Checks of earthquake_catalog run with pytest:
+            python -m pytest test_earthquake_catalog.py
+Revisions: 00 - Group percentile bounds
+'''
+# Import necessary libraries
+import numpy as np  # For comparing against np.percentile
+import pytest  # For the test runner and expected errors
+from earthquake_catalog import load_catalog
+
+ROWS = """Date,Time,Latitude,Longitude,Type,Depth,Magnitude,Magnitude Type
+01/02/1965,13:44:18,19.2,145.6,Earthquake,131.6,6.0,MW
+03/04/1965,11:29:49,1.8,127.3,Earthquake,80,5.8,MW
+05/06/1965,18:05:58,-20.5,-173.9,Earthquake,20,6.2,MW
+01/02/1966,13:44:18,-59.7,-23.3,Earthquake,15,5.5,MW
+07/08/1966,11:29:49,11.9,126.4,Earthquake,15,6.7,MW
+"""
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "earthquakes.csv"
+    path.write_text(ROWS)
+    return load_catalog(str(path))
+
+
+def test_percentile_ends(catalog):
+    groups = catalog.all().group_by('year')
+    assert list(groups.keys) == [1965, 1966]
+    assert list(groups.percentile('mag', 0)) == [5.8, 5.5]
+    assert list(groups.percentile('mag', 100)) == [6.2, 6.7]
+    assert groups.percentile('mag', 50)[0] == np.percentile([6.0, 5.8, 6.2], 50)
+
+
+@pytest.mark.parametrize('q', [-50, -0.001, 100.001, 200])
+def test_percentile_outside_range(catalog, q):
+    with pytest.raises(ValueError):
+        catalog.all().group_by('year').percentile('mag', q)